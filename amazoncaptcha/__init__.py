@@ -40,7 +40,16 @@ Examples:
 """
 
 from .solver import AmazonCaptcha
-from .devtools import AmazonCaptchaCollector
-from .exceptions import ContentTypeError, NotFolderError
+from .engine import SolverEngine
+from .exceptions import ContentTypeError, NotFolderError, TrainingDataError
+
+def __getattr__(name):
+    """Imports the collector, and with it requests and multiprocessing, on first use."""
+
+    if name == 'AmazonCaptchaCollector':
+        from .devtools import AmazonCaptchaCollector
+        return AmazonCaptchaCollector
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 #--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.aio
+~~~~~~~~~~~~~~~~~
+
+This module contains the asyncio requiries for `AmazonCaptcha.afromlink`
+and `AmazonCaptcha.asolve`.
+
+Every event loop gets its own keep-alive `aiohttp.ClientSession` and a
+semaphore bounding the number of simultaneous requests. The session is
+closed when `asyncio.run` shuts the loop down, loops run otherwise have to
+call `close_session` themselves. Solving is moved off the loop to a shared
+thread pool. aiohttp is an optional dependency,
+installed with `pip install amazoncaptcha[async]`.
+
+Attributes:
+    CONNECTION_LIMIT (int): Size of the connection pool of every session.
+    CONCURRENCY (int): Maximum number of simultaneous requests per loop.
+    SOLVER_THREADS (int): Number of threads solving captchas off the loop.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+import asyncio
+import weakref
+import os
+
+#--------------------------------------------------------------------------------------------------------------
+
+CONNECTION_LIMIT = 100
+CONCURRENCY = 32
+SOLVER_THREADS = os.cpu_count() or 1
+
+_loop_states = weakref.WeakKeyDictionary()
+_executor = None
+_executor_lock = threading.Lock()
+
+#--------------------------------------------------------------------------------------------------------------
+
+def _import_aiohttp():
+    """Imports aiohttp, explaining how to install it if it is missing."""
+
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError('aiohttp is required for the asyncio API, install it with "pip install amazoncaptcha[async]".')
+
+    return aiohttp
+
+def _get_loop_state():
+    """Returns the mutable [session, semaphore, watcher] state of the running event loop."""
+
+    loop = asyncio.get_running_loop()
+
+    if loop not in _loop_states:
+        state = [None, asyncio.Semaphore(CONCURRENCY), None]
+        state[2] = loop.create_task(_close_on_shutdown(state))
+        _loop_states[loop] = state
+
+    return _loop_states[loop]
+
+async def _close_on_shutdown(state):
+    """Waits until the task is cancelled, on loop shutdown or by `close_session`, and closes the session."""
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        await loop.create_future()
+
+    finally:
+        if _loop_states.get(loop) is state:
+            del _loop_states[loop]
+
+        if state[0] is not None and not state[0].closed:
+            await state[0].close()
+
+def get_session():
+    """
+    Returns the pooled session of the running event loop.
+
+    Returns:
+        aiohttp.ClientSession: Keep-alive session, created on the first call.
+
+    """
+
+    state = _get_loop_state()
+
+    if state[0] is None or state[0].closed:
+        aiohttp = _import_aiohttp()
+        state[0] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONNECTION_LIMIT))
+
+    return state[0]
+
+async def close_session():
+    """
+    Closes the pooled session of the running event loop, if there is one.
+
+    `asyncio.run` does it on its own when it shuts the loop down. Loops run
+    with `run_until_complete` or `run_forever` must call it before they are
+    closed, otherwise the session and the loop are never released.
+    """
+
+    state = _loop_states.get(asyncio.get_running_loop())
+
+    if state is not None:
+        state[2].cancel()
+        await asyncio.wait([state[2]])
+
+def get_executor():
+    """
+    Returns the thread pool that solves captchas off the event loop.
+
+    Returns:
+        concurrent.futures.ThreadPoolExecutor: Shared executor.
+
+    """
+
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SOLVER_THREADS, thread_name_prefix='amazoncaptcha')
+
+    return _executor
+
+async def fetch(url, timeout=120, session=None, semaphore=None):
+    """
+    Requests the given url through the pooled session.
+
+    Args:
+        url (str): Url to be requested.
+        timeout (int, optional): Request timeout in seconds.
+        session (aiohttp.ClientSession, optional): Session to use instead
+            of the pooled one.
+        semaphore (asyncio.Semaphore, optional): Semaphore to bound the
+            request by instead of the one of the running loop.
+
+    Returns:
+        tuple: Content-Type of the response and its content.
+
+    """
+
+    aiohttp = _import_aiohttp()
+    semaphore = semaphore or _get_loop_state()[1]
+
+    async with semaphore:
+        async with (session or get_session()).get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return response.headers.get('Content-Type'), await response.read()
+
+async def run_in_executor(func, *args, executor=None, **kwargs):
+    """
+    Runs a blocking function off the event loop.
+
+    Args:
+        func (callable): Function to be run.
+        executor (concurrent.futures.Executor, optional): Executor to run
+            the function in. Defaults to `get_executor()`.
+
+    Returns:
+        The result of the function.
+
+    """
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(executor or get_executor(), functools.partial(func, *args, **kwargs))
+
+#--------------------------------------------------------------------------------------------------------------
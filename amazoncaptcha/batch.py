@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.batch
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the warm process pools behind `AmazonCaptcha.solve_many`.
+
+Pools are created once per number of workers and kept until the interpreter
+exits. Every worker loads the training index in its initializer, so a batch
+never pays the solver setup again.
+
+When the default engine has a cache, the whole batch is looked up in the
+calling process at once and only the misses are sent to the pool.
+
+Attributes:
+    SERIAL_THRESHOLD (int): Batches smaller than this are solved in the
+        calling process without touching a pool.
+    CHUNKS_PER_WORKER (int): Default number of chunks a batch is split into
+        for every worker.
+
+"""
+
+from .engine import get_default_engine, format_solution, format_devmode_solution
+from .cache import cache_keys
+
+import multiprocessing
+import threading
+import atexit
+import os
+
+#--------------------------------------------------------------------------------------------------------------
+
+SERIAL_THRESHOLD = 16
+CHUNKS_PER_WORKER = 4
+
+_pools = dict()
+_pools_lock = threading.Lock()
+
+#--------------------------------------------------------------------------------------------------------------
+
+def _initialize_worker():
+    """Loads the training index once per worker process."""
+
+    get_default_engine()
+
+def _solve(job):
+    """Solves a single prepared image inside a worker."""
+
+    image, devmode = job
+
+    return get_default_engine().solve(image, devmode)
+
+def _classify(image):
+    """Solves a single prepared image inside a worker in dev mode, bypassing the cache."""
+
+    return format_solution(get_default_engine().classify_image(image), devmode=True)
+
+def _read(image):
+    """Reads a prepared image into bytes."""
+
+    if isinstance(image, bytes):
+        return image
+
+    with open(image, 'rb') as f:
+        return f.read()
+
+def _prepare(image):
+    """
+    Turns an image into something that can be sent to a worker.
+
+    Paths are sent as they are, buffers are sent as bytes and file objects
+    are read in the calling process.
+    """
+
+    if isinstance(image, (str, os.PathLike)):
+        return os.fspath(image)
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+
+    return image.read()
+
+def map_jobs(function, jobs, processes=None, chunksize=None, serial_threshold=SERIAL_THRESHOLD):
+    """
+    Runs jobs in the calling process or in a warm pool, preserving their order.
+
+    Args:
+        function (callable): Module-level function of a single job, so that
+            it can be sent to the workers.
+        jobs (list): Jobs to be run.
+        processes (int, optional): Number of worker processes. Defaults to
+            the number of CPUs.
+        chunksize (int, optional): Number of jobs sent to a worker at once.
+            Defaults to splitting the jobs into `CHUNKS_PER_WORKER` chunks
+            per worker.
+        serial_threshold (int, optional): Fewer jobs than this are run in
+            the calling process.
+
+    Returns:
+        list: Results in the order of the jobs.
+
+    """
+
+    processes = processes or os.cpu_count() or 1
+
+    if processes == 1 or len(jobs) < serial_threshold:
+        return [function(job) for job in jobs]
+
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (processes * CHUNKS_PER_WORKER))
+
+    return get_pool(processes).map(function, jobs, chunksize)
+
+def get_pool(processes=None):
+    """
+    Returns a warm process pool, creating it on the first call.
+
+    Args:
+        processes (int, optional): Number of worker processes. Defaults to
+            the number of CPUs.
+
+    Returns:
+        multiprocessing.pool.Pool: Pool with the training index preloaded
+            in every worker.
+
+    """
+
+    processes = processes or os.cpu_count() or 1
+
+    with _pools_lock:
+        if processes not in _pools:
+            _pools[processes] = multiprocessing.Pool(processes, initializer=_initialize_worker)
+
+    return _pools[processes]
+
+def close_pools():
+    """Terminates every pool created by `get_pool`."""
+
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.terminate()
+            pool.join()
+
+        _pools.clear()
+
+def solve_many(images, devmode=False, processes=None, chunksize=None, serial_threshold=SERIAL_THRESHOLD):
+    """
+    Solves a batch of captchas, preserving their order.
+
+    Args:
+        images (iterable): Paths, bytes-like objects or file objects.
+        devmode (bool, optional): If set to True, instead of 'Not solved',
+            unrecognised letters will be replaced with dashes.
+        processes (int, optional): Number of worker processes. Defaults to
+            the number of CPUs.
+        chunksize (int, optional): Number of captchas sent to a worker at
+            once. Defaults to splitting the batch into `CHUNKS_PER_WORKER`
+            chunks per worker.
+        serial_threshold (int, optional): Batches smaller than this are
+            solved in the calling process.
+
+    Returns:
+        :obj:`list` of :obj:`str`: Solutions in the order of the images.
+
+    """
+
+    cache = get_default_engine().cache
+    processes = processes or os.cpu_count() or 1
+
+    if cache is None:
+        jobs = [(_prepare(image), devmode) for image in images]
+        return map_jobs(_solve, jobs, processes, chunksize, serial_threshold)
+
+    images = [_read(_prepare(image)) for image in images]
+    keys_list = [cache_keys(image) for image in images]
+    solutions = cache.lookup_many(keys_list)
+
+    misses = [position for position, solution in enumerate(solutions) if solution is None]
+    solved = map_jobs(_classify, [images[position] for position in misses], processes, chunksize, serial_threshold)
+
+    for position, solution in zip(misses, solved):
+        solutions[position] = solution
+
+    cache.store_many([(keys_list[position], solutions[position]) for position in misses])
+
+    return [format_devmode_solution(solution, devmode) for solution in solutions]
+
+atexit.register(close_pools)
+
+#--------------------------------------------------------------------------------------------------------------
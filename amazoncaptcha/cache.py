@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.cache
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the opt-in solution cache of the solver engine.
+
+Amazon serves captchas from a finite pool, so the same images come again and
+again. Solutions are cached under a hash of the raw image bytes, so a hit
+skips decoding entirely.
+
+The cache always keeps a bounded in-memory LRU in front of optional backends:
+an on-disk SQLite tier that survives restarts, and any shared backend with
+`get_many` and `set_many`, such as `SocketBackend` talking to a `CacheServer`
+that many nodes use at once. Lookups of a whole batch of captchas take a
+single round trip per backend.
+
+Solutions are stored in dev mode, with dashes for unrecognised letters, and
+turned into 'Not solved' on the way out when needed.
+
+Attributes:
+    MAXSIZE (int): Default number of solutions kept in memory.
+
+"""
+
+from collections import OrderedDict
+import socketserver
+import threading
+import hashlib
+import sqlite3
+import socket
+import json
+import os
+
+#--------------------------------------------------------------------------------------------------------------
+
+MAXSIZE = 10000
+
+_BACKEND_ERRORS = (OSError, sqlite3.Error, ValueError, KeyError)
+
+#--------------------------------------------------------------------------------------------------------------
+
+def cache_keys(data):
+    """
+    Builds the cache keys of a captcha.
+
+    Args:
+        data (bytes): Raw image bytes.
+
+    Returns:
+        :obj:`list` of :obj:`str`: Content hash key.
+
+    """
+
+    return ['sha:' + hashlib.blake2b(data, digest_size=16).hexdigest()]
+
+#--------------------------------------------------------------------------------------------------------------
+
+class CacheBackend(object):
+    """
+    Interface of a cache backend.
+
+    A backend maps string keys to string values. Subclasses implement
+    `get_many` and `set_many`, each of them being a single round trip.
+    """
+
+    def get_many(self, keys):
+        """
+        Looks up several keys at once.
+
+        Args:
+            keys (:obj:`list` of :obj:`str`): Keys to be looked up.
+
+        Returns:
+            dict: Found keys and their values. Missing keys are left out.
+
+        """
+
+        raise NotImplementedError
+
+    def set_many(self, items):
+        """
+        Stores several values at once.
+
+        Args:
+            items (dict): Keys and values to be stored.
+
+        """
+
+        raise NotImplementedError
+
+    def get(self, key):
+        """
+        Looks up a single key.
+
+        Args:
+            key (str): Key to be looked up.
+
+        Returns:
+            str: Value OR None if the key is missing.
+
+        """
+
+        return self.get_many([key]).get(key)
+
+class MemoryBackend(CacheBackend):
+
+    def __init__(self, maxsize=MAXSIZE):
+        """
+        Initializes the in-process MemoryBackend instance.
+
+        Args:
+            maxsize (int, optional): Number of values kept. The least
+                recently used ones are evicted first.
+
+        """
+
+        self.maxsize = maxsize
+
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_many(self, keys):
+        found = dict()
+
+        with self._lock:
+            for key in keys:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    found[key] = self._items[key]
+
+        return found
+
+    def set_many(self, items):
+
+        with self._lock:
+            for key, value in items.items():
+                self._items[key] = value
+                self._items.move_to_end(key)
+
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """Drops every value."""
+
+        with self._lock:
+            self._items.clear()
+
+    def __getstate__(self):
+        return {'maxsize': self.maxsize, '_items': self._items}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+class SQLiteBackend(CacheBackend):
+
+    def __init__(self, path):
+        """
+        Initializes the on-disk SQLiteBackend instance.
+
+        Args:
+            path (str): Path to the SQLite file. It is created if missing
+                and can be shared by the processes of one machine.
+
+        """
+
+        self.path = path
+
+        self._connection = None
+        self._connection_pid = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        """Opens the SQLite file, once per process."""
+
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS solutions (key TEXT PRIMARY KEY, solution TEXT NOT NULL)')
+            self._connection_pid = os.getpid()
+
+        return self._connection
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = dict()
+
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                query = f'SELECT key, solution FROM solutions WHERE key IN ({", ".join("?" * len(chunk))})'
+                found.update(self._get_connection().execute(query, chunk).fetchall())
+
+        return found
+
+    def set_many(self, items):
+
+        with self._lock:
+            self._get_connection().executemany('INSERT OR REPLACE INTO solutions VALUES (?, ?)', list(items.items()))
+
+    def clear(self):
+        """Drops every value."""
+
+        with self._lock:
+            self._get_connection().execute('DELETE FROM solutions')
+
+    def close(self):
+        """Closes the SQLite file."""
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+class SocketBackend(CacheBackend):
+
+    def __init__(self, address, timeout=5):
+        """
+        Initializes the SocketBackend instance, a client of `CacheServer`.
+
+        The connection is opened on first use and kept alive. Requests are
+        newline-delimited JSON documents.
+
+        Args:
+            address (tuple): Host and port of the cache server.
+            timeout (float, optional): Socket timeout in seconds.
+
+        """
+
+        self.address = tuple(address)
+        self.timeout = timeout
+
+        self._file = None
+        self._file_pid = None
+        self._lock = threading.Lock()
+
+    def _request(self, request):
+        """
+        Sends a request and reads its response, reconnecting once if needed.
+
+        Raises ValueError if the response is not JSON or reports an error.
+        """
+
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._file is None or self._file_pid != os.getpid():
+                        self._file = socket.create_connection(self.address, self.timeout).makefile('rwb')
+                        self._file_pid = os.getpid()
+
+                    self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+                    self._file.flush()
+
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError(f'Cache server {self.address} closed the connection.')
+
+                    response = json.loads(line)
+
+                except OSError:
+                    self._file = None
+
+                    if attempt:
+                        raise
+
+                    continue
+
+                except ValueError:
+                    self._file = None
+                    raise
+
+                if 'error' in response:
+                    raise ValueError(f'Cache server {self.address} answered with an error: {response["error"]}')
+
+                return response
+
+    def get_many(self, keys):
+        return self._request({'op': 'get_many', 'keys': list(keys)})['items']
+
+    def set_many(self, items):
+        self._request({'op': 'set_many', 'items': dict(items)})
+
+    def close(self):
+        """Closes the connection."""
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __getstate__(self):
+        return {'address': self.address, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+class _CacheRequestHandler(socketserver.StreamRequestHandler):
+    """Answers newline-delimited JSON requests of `SocketBackend`."""
+
+    def handle(self):
+
+        for line in self.rfile:
+            request = json.loads(line)
+
+            if request['op'] == 'get_many':
+                response = {'items': self.server.backend.get_many(request['keys'])}
+
+            elif request['op'] == 'set_many':
+                self.server.backend.set_many(request['items'])
+                response = {'ok': True}
+
+            else:
+                response = {'error': f'unknown operation "{request["op"]}"'}
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+class CacheServer(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), backend=None):
+        """
+        Initializes the CacheServer instance, a reference shared cache.
+
+        Serves any backend to `SocketBackend` clients over TCP. Meant to be
+        run locally or on a trusted network as a stand-in for a shared cache.
+
+        Args:
+            address (tuple, optional): Host and port to listen on. Port 0
+                picks a free one, see `server_address`.
+            backend (CacheBackend, optional): Where values are kept.
+                Defaults to an unbounded-ish `MemoryBackend`.
+
+        """
+
+        self.backend = backend or MemoryBackend(maxsize=MAXSIZE * 100)
+
+        super().__init__(address, _CacheRequestHandler)
+
+    def start(self):
+        """
+        Serves requests from a background thread.
+
+        Returns:
+            threading.Thread: The serving thread.
+
+        """
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+        return thread
+
+#--------------------------------------------------------------------------------------------------------------
+
+class SolutionCache(object):
+
+    def __init__(self, maxsize=MAXSIZE, path=None, backend=None):
+        """
+        Initializes the SolutionCache instance.
+
+        Args:
+            maxsize (int, optional): Number of solutions kept in memory.
+                The least recently used ones are evicted first.
+            path (str, optional): Path to the SQLite file of the on-disk
+                tier. There is no on-disk tier if not set.
+            backend (CacheBackend, optional): Shared backend looked up after
+                the in-memory and on-disk tiers, e.g. a `SocketBackend`.
+
+        """
+
+        self.maxsize = maxsize
+        self.path = path
+
+        self.memory = MemoryBackend(maxsize)
+        self.backends = list()
+
+        if path is not None:
+            self.backends.append(SQLiteBackend(path))
+
+        if backend is not None:
+            self.backends.append(backend)
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        self._lock = threading.Lock()
+
+    def lookup_many(self, keys_list):
+        """
+        Looks up the solutions of a batch of captchas.
+
+        Every tier is asked once for all the keys that are still missing.
+        Counts a single hit or miss per captcha. A failing backend counts
+        an error and is treated as a miss.
+
+        Args:
+            keys_list (:obj:`list` of :obj:`list`): Keys of every captcha, as
+                built by `cache_keys`.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Solutions in dev mode, None for the
+                captchas that are not cached.
+
+        """
+
+        wanted = {key for keys in keys_list for key in keys}
+        found = self.memory.get_many(wanted)
+
+        for backend in self.backends:
+            missing = [key for key in wanted if key not in found]
+            if not missing:
+                break
+
+            try:
+                backend_found = backend.get_many(missing)
+
+            except _BACKEND_ERRORS:
+                with self._lock:
+                    self.errors += 1
+                continue
+
+            self.memory.set_many(backend_found)
+            found.update(backend_found)
+
+        solutions = [next((found[key] for key in keys if key in found), None) for keys in keys_list]
+
+        with self._lock:
+            hits = len(solutions) - solutions.count(None)
+            self.hits += hits
+            self.misses += len(solutions) - hits
+
+        return solutions
+
+    def lookup(self, keys):
+        """
+        Looks up the solution of one captcha.
+
+        Args:
+            keys (:obj:`list` of :obj:`str`): Keys, as built by `cache_keys`.
+
+        Returns:
+            str: Solution in dev mode OR None if it is not cached.
+
+        """
+
+        return self.lookup_many([keys])[0]
+
+    def get(self, key):
+        """
+        Looks up a cached solution by a single key.
+
+        Args:
+            key (str): Cache key, as built by `cache_keys`.
+
+        Returns:
+            str: Solution in dev mode OR None if it is not cached.
+
+        """
+
+        return self.lookup([key])
+
+    def store_many(self, entries):
+        """
+        Caches the solutions of a batch of captchas, in one round trip per tier.
+
+        Args:
+            entries (:obj:`list` of :obj:`tuple`): Keys of every captcha, as
+                built by `cache_keys`, and its solution in dev mode.
+
+        """
+
+        items = {key: solution for keys, solution in entries for key in keys}
+
+        if not items:
+            return
+
+        self.memory.set_many(items)
+
+        for backend in self.backends:
+            try:
+                backend.set_many(items)
+
+            except _BACKEND_ERRORS:
+                with self._lock:
+                    self.errors += 1
+
+    def store(self, keys, solution):
+        """
+        Caches a solution under every key of one captcha.
+
+        Args:
+            keys (:obj:`list` of :obj:`str`): Keys, as built by `cache_keys`.
+            solution (str): Solution in dev mode.
+
+        """
+
+        self.store_many([(keys, solution)])
+
+    def set(self, key, solution):
+        """
+        Caches a solution.
+
+        Args:
+            key (str): Cache key, as built by `cache_keys`.
+            solution (str): Solution in dev mode.
+
+        """
+
+        self.store([key], solution)
+
+    def stats(self):
+        """
+        Reports cache counters.
+
+        Failed backend calls are counted separately in `errors`.
+
+        Returns:
+            dict: Number of hits, misses and solutions kept in memory.
+
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.memory)}
+
+    def clear(self):
+        """Drops every cached solution in memory and on disk."""
+
+        self.memory.clear()
+
+        for backend in self.backends:
+            if isinstance(backend, SQLiteBackend):
+                backend.clear()
+
+    def close(self):
+        """Closes the connections of every backend that has them."""
+
+        for backend in self.backends:
+            if hasattr(backend, 'close'):
+                backend.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+#--------------------------------------------------------------------------------------------------------------
@@ -5,22 +5,224 @@ amazoncaptcha.devtools
 ~~~~~~~~~~~~~~~~~~~~~~
 
 This module contains the set of amazoncaptcha's devtools.
+
+Attributes:
+    VALIDATE_CAPTCHA_URL (str): Page that shows a random captcha.
+    DOWNLOADS_PER_PROCESS (int): Default number of download threads per
+        solving process of `AmazonCaptchaCollector.start`.
+    REPORT_EVERY (int): Default number of processed captchas between two
+        progress reports.
+    CONCURRENT_FETCHES (int): Default number of simultaneous requests of
+        `AmazonCaptchaCollector.astart`.
+    LOG_BATCH_SIZE (int): Maximum number of log records written at once.
+    LABELED_IMAGE_PATTERN (re.Pattern): Name of an image stored by
+        `AmazonCaptchaCollector`, `dl_<id>_<solution>.png`.
+
 """
 
 from .solver import AmazonCaptcha
+from .session import get_session
+from .engine import get_default_engine, load_image, monochrome, extract_letters_with_outcome
+from .training import TRAINING_DATA_FOLDER, MAX_SEGMENTS, fingerprint, pseudo_binary, open_training_index
+from .training import write_segment, list_segments, compact_training_data
+from .utils import extract_captcha_id
 from .exceptions import NotFolderError
 from .__version__ import __version__
 
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 from io import BytesIO
-import multiprocessing
-import requests
+import threading
+import asyncio
+import queue
+import json
+import time
+import re
 import os
 
 #--------------------------------------------------------------------------------------------------------------
 
+VALIDATE_CAPTCHA_URL = 'https://www.amazon.com/errors/validateCaptcha'
+DOWNLOADS_PER_PROCESS = 4
+REPORT_EVERY = 100
+CONCURRENT_FETCHES = 200
+LOG_BATCH_SIZE = 256
+LABELED_IMAGE_PATTERN = re.compile(r'^dl_(?P<id>.+)_(?P<solution>[A-Za-z]+)\.(png|jpe?g)$')
+
+#--------------------------------------------------------------------------------------------------------------
+
+def _solve_captcha(content, encode):
+    """
+    Solves a downloaded captcha, encoding the original image as PNG if needed.
+
+    The image is encoded from the downloaded bytes rather than from
+    `AmazonCaptcha.img`, which is decoded straight to grayscale for solving.
+
+    Lives at module level, so it can be run by a process pool.
+    """
+
+    started = time.perf_counter()
+
+    solution = AmazonCaptcha(content).solve()
+
+    png = None
+    if encode and solution != 'Not solved':
+        png = BytesIO()
+        Image.open(BytesIO(content)).save(png, format='PNG')
+        png = png.getvalue()
+
+    return solution, png, time.perf_counter() - started
+
+def _evaluate_captcha(path):
+    """
+    Classifies a labeled captcha, bypassing the cache.
+
+    Lives at module level, so it can be run by a process pool.
+
+    Returns:
+        tuple: Letters with dashes for unrecognised ones, and the outcome of
+            the segmentation.
+    """
+
+    letters, outcome = extract_letters_with_outcome(monochrome(load_image(path)))
+
+    if outcome.startswith('failed.'):
+        return None, outcome
+
+    letters = get_default_engine().classify_fingerprints([fingerprint(letter) for letter in letters])
+
+    return ''.join(letter or '-' for letter in letters), outcome
+
+def _labeled_images(folder):
+    """Lists sorted pairs of paths and expected solutions of a folder's labeled images."""
+
+    images = list()
+    for filename in sorted(os.listdir(folder)):
+        match = LABELED_IMAGE_PATTERN.match(filename)
+
+        if match:
+            images.append((os.path.join(folder, filename), match.group('solution').upper()))
+
+    return images
+
+class CollectorLog(object):
+
+    def __init__(self, path, not_solved_path=None, batch_size=LOG_BATCH_SIZE):
+        """
+        Initializes the CollectorLog instance, the single writer of collector logs.
+
+        Every processed captcha is a JSON record with its link, id, solution
+        and timings, appended to `path` as one line. Links of captchas that
+        were not solved are also appended to `not_solved_path`. Once opened,
+        records are queued and written in batches by a background thread,
+        otherwise they are written right away.
+
+        Accuracy is counted as records come, without reading the files.
+
+        Args:
+            path (str): JSON lines file of all records.
+            not_solved_path (str, optional): File of not solved captcha links.
+            batch_size (int, optional): Maximum number of records written at once.
+
+        """
+
+        self.path = path
+        self.not_solved_path = not_solved_path
+        self.batch_size = batch_size
+
+        self.processed = 0
+        self.solved = 0
+
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Starts writing from a background thread."""
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Writes the queued records and stops the background thread."""
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+
+        self._queue = None
+        self._thread = None
+
+    def write(self, record):
+        """
+        Logs a processed captcha.
+
+        Args:
+            record (dict): Record with at least `link` and `solved` keys.
+
+        """
+
+        with self._lock:
+            self.processed += 1
+            self.solved += record['solved']
+
+        if self._queue is not None:
+            self._queue.put(record)
+
+        else:
+            self._write([record])
+
+    def summary(self):
+        """
+        Reports the accuracy of the records logged so far.
+
+        Returns:
+            dict: Number of processed and solved captchas and the share of
+                solved ones in percents.
+
+        """
+
+        with self._lock:
+            accuracy = round((self.solved / self.processed) * 100, 5) if self.processed else 0.0
+            return {'processed': self.processed, 'solved': self.solved, 'accuracy': accuracy}
+
+    def _run(self):
+        """Writes queued records in batches until `close` is called."""
+
+        while True:
+            records = [self._queue.get()]
+
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopped = None in records
+            records = [record for record in records if record is not None]
+
+            if records:
+                self._write(records)
+
+            if stopped:
+                return
+
+    def _write(self, records):
+        """Appends records to the files with a single write per file."""
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+
+        not_solved = [record['link'] + '\n' for record in records if not record['solved']]
+
+        if self.not_solved_path and not_solved:
+            with open(self.not_solved_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(not_solved))
+
 class AmazonCaptchaCollector(object):
 
-    def __init__(self, output_folder_path, keep_logs=True, accuracy_test=False):
+    def __init__(self, output_folder_path, keep_logs=True, accuracy_test=False, session=None, validate_captcha_url=VALIDATE_CAPTCHA_URL):
         """
         Initializes the AmazonCaptchaCollector instance.
 
@@ -30,12 +232,21 @@ class AmazonCaptchaCollector(object):
                 will be stored separately.
             accuracy_test (bool, optional): If set to True, AmazonCaptchaCollector
                 will not download images but just solve them and log the results.
+            session (requests.Session, optional): Session to use instead of
+                the shared keep-alive one of every process.
+            validate_captcha_url (str, optional): Page that shows a random
+                captcha, e.g. a local stub for testing.
+
+        Every processed captcha is logged to `collector_logs` as a JSON line,
+        see `CollectorLog`.
 
         """
 
         self.output_folder = output_folder_path
         self.keep_logs = keep_logs
         self.accuracy_test = accuracy_test
+        self.session = session
+        self.validate_captcha_url = validate_captcha_url
 
         if not os.path.exists(self.output_folder):
             os.mkdir(self.output_folder)
@@ -47,18 +258,22 @@ class AmazonCaptchaCollector(object):
         self.test_results = os.path.join(self.output_folder, 'test-results.log')
         self.not_solved_logs = os.path.join(self.output_folder, 'not-solved-captcha.log')
 
+        self.log = CollectorLog(self.collector_logs, self.not_solved_logs if self.keep_logs else None)
+
     def _extract_captcha_link(self, captcha_page):
         """Extracts a captcha link from an html page.
 
         Args:
-            captcha_page (str): A page's html in string format.
+            captcha_page (requests.Response or str): A page or its html.
 
         Returns:
             str: Captcha link.
 
         """
 
-        return captcha_page.text.split('<img src="')[1].split('">')[0]
+        captcha_page = getattr(captcha_page, 'text', captcha_page)
+
+        return captcha_page.split('<img src="')[1].split('">')[0]
 
     def _extract_captcha_id(self, captcha_link):
         """
@@ -72,79 +287,538 @@ class AmazonCaptchaCollector(object):
 
         """
 
-        return ''.join(captcha_link.split('/captcha/')[1].replace('.jpg', '').split('/Captcha_'))
+        return extract_captcha_id(captcha_link)
 
-    def get_captcha_image(self):
+    def download_captcha(self):
+        """
+        Requests the page with Amazon's captcha and downloads a random captcha.
+
+        Returns:
+            tuple: Captcha link and raw image bytes.
+
+        """
+
+        session = self.session or get_session()
+
+        captcha_page = session.get(self.validate_captcha_url)
+        captcha_link = self._extract_captcha_link(captcha_page)
+
+        response = session.get(captcha_link)
+
+        return captcha_link, response.content
+
+    def process_captcha(self, captcha_link, content, download_time=None):
         """
-        Requests the page with Amazon's captcha, gets random captcha.
         Creates AmazonCaptcha instance, stores an original image before solving.
 
         If it is not an accuracy test, the image will be stored in a specified
-        folder with the solution within its name. Otherwise, only the logs
-        will be stored, mentioning the captcha link being processed and the result.
+        folder with the solution within its name. Either way, the captcha is
+        logged with its link, id, solution and timings.
+
+        Args:
+            captcha_link (str): Link the captcha was downloaded from.
+            content (bytes): Raw image bytes.
+            download_time (float, optional): Seconds the download took.
+
+        Returns:
+            str: Solution.
 
         """
 
-        captcha_page = requests.get('https://www.amazon.com/errors/validateCaptcha')
-        captcha_link = self._extract_captcha_link(captcha_page)
+        solution, png, solve_time = _solve_captcha(content, not self.accuracy_test)
+        self._store(captcha_link, solution, png, {'download': download_time, 'solve': solve_time})
 
-        response = requests.get(captcha_link)
-        captcha = AmazonCaptcha(BytesIO(response.content))
-        captcha._image_link = captcha_link
-        original_image = captcha.img
+        return solution
 
-        solution = captcha.solve(keep_logs=self.keep_logs, logs_path=self.not_solved_logs)
-        log_message = f'{captcha.image_link}::{solution}'
+    def _store(self, captcha_link, solution, png, timings):
+        """Stores a solved captcha's image and logs the captcha."""
 
-        if solution != 'Not solved' and not self.accuracy_test:
-            print(log_message)
-            captcha_name = 'dl_' + self._extract_captcha_id(captcha.image_link) + '_' + solution + '.png'
-            original_image.save(os.path.join(self.output_folder, captcha_name))
+        started = time.perf_counter()
+        captcha_id = self._extract_captcha_id(captcha_link)
+        print(f'{captcha_link}::{solution}')
 
-        else:
-            print(log_message)
-            with open(self.collector_logs, 'a', encoding='utf-8') as f:
-                f.write(log_message + '\n')
+        if png is not None:
+            captcha_name = 'dl_' + captcha_id + '_' + solution + '.png'
 
-    def _distribute_collecting(self, milestone):
-        """Distribution function for multiprocessing."""
+            with open(os.path.join(self.output_folder, captcha_name), 'wb') as f:
+                f.write(png)
 
-        for step in milestone:
-            self.get_captcha_image()
+        timings = dict(timings, store=time.perf_counter() - started)
+        self.log.write({'link': captcha_link, 'id': captcha_id, 'solution': solution, 'solved': solution != 'Not solved', 'timings': timings, 'time': time.time()})
 
-    def start(self, target, processes):
+    def get_captcha_image(self):
+        """
+        Downloads, solves and stores a single random captcha.
+
+        Returns:
+            str: Solution.
+
+        """
+
+        started = time.perf_counter()
+        captcha_link, content = self.download_captcha()
+
+        return self.process_captcha(captcha_link, content, time.perf_counter() - started)
+
+    def _download(self, events):
+        """Downloads a captcha for `start`, reporting the outcome to the events queue."""
+
+        started = time.perf_counter()
+
+        try:
+            captcha_link, content = self.download_captcha()
+            events.put(('downloaded', (captcha_link, content, time.perf_counter() - started)))
+
+        except Exception as e:
+            events.put(('failed', e))
+
+    def _report(self, processed, target, started):
+        """Prints the progress, throughput and running accuracy of `start`."""
+
+        elapsed = time.perf_counter() - started
+        print(f'Processed {processed}/{target} captchas, {processed / elapsed if elapsed else 0.0:.2f} captchas/s, {self.log.summary()["accuracy"]}% solved')
+
+    def start(self, target, processes, downloads=None, max_errors=None, report_every=REPORT_EVERY):
         """
         Starts the process of collecting captchas or conducting a test.
 
+        Captchas are downloaded by a pool of threads and solved by a warm
+        pool of processes at the same time. Every worker takes the next job
+        as soon as it is free, and failed jobs are replaced with new ones,
+        so exactly `target` captchas are processed. No more than `downloads`
+        downloads are queued at once, so giving up only waits for those.
+        Results are stored and logged by this process alone, through `log`.
+
+        Args:
+            target (int): Number of captchas to be processed.
+            processes (int): Number of simultaneous solving processes.
+            downloads (int, optional): Number of simultaneous downloads.
+                Defaults to `DOWNLOADS_PER_PROCESS` per process.
+            max_errors (int, optional): Number of failed downloads or solves
+                tolerated before giving up. Defaults to `target`.
+            report_every (int, optional): Number of processed captchas between
+                two progress reports. 0 disables them.
+
+        Returns:
+            dict: Number of processed, solved and failed captchas, elapsed
+                seconds and captchas per second.
+
+        Raises:
+            RuntimeError: If more than `max_errors` jobs failed.
+
+        """
+
+        from .batch import get_pool
+
+        processes = max(1, processes)
+        downloads = downloads or processes * DOWNLOADS_PER_PROCESS
+        max_errors = target if max_errors is None else max_errors
+
+        events = queue.Queue()
+        processed = solved = errors = 0
+        started = time.perf_counter()
+
+        def solve(captcha_link, content, download_time):
+            pool.apply_async(
+                _solve_captcha, (content, not self.accuracy_test),
+                callback=lambda result: events.put(('solved', (captcha_link, download_time) + result)),
+                error_callback=lambda e: events.put(('failed', e))
+            )
+
+        pool = get_pool(processes)
+        self.log.open()
+        try:
+            with ThreadPoolExecutor(downloads) as downloader:
+                remaining = target
+
+                for job in range(min(target, downloads)):
+                    downloader.submit(self._download, events)
+                    remaining -= 1
+
+                while processed < target:
+                    event, value = events.get()
+
+                    if event == 'downloaded':
+                        solve(*value)
+
+                        if remaining:
+                            downloader.submit(self._download, events)
+                            remaining -= 1
+
+                        continue
+
+                    if event == 'solved':
+                        captcha_link, download_time, solution, png, solve_time = value
+
+                        try:
+                            self._store(captcha_link, solution, png, {'download': download_time, 'solve': solve_time})
+
+                        except OSError as e:
+                            event, value = 'failed', e
+
+                    if event == 'solved':
+                        processed += 1
+                        solved += solution != 'Not solved'
+
+                        if report_every and (processed % report_every == 0 or processed == target):
+                            self._report(processed, target, started)
+
+                        continue
+
+                    errors += 1
+
+                    if errors > max_errors:
+                        raise RuntimeError(f'Collecting stopped after {errors} failed jobs, the last one failed with: {value!r}')
+
+                    downloader.submit(self._download, events)
+
+        finally:
+            self.log.close()
+
+        return self._finish(processed, solved, errors, started)
+
+    def _finish(self, processed, solved, errors, started):
+        """Summarizes a collecting run, writing the accuracy test results if needed."""
+
+        elapsed = time.perf_counter() - started
+        results = {'processed': processed, 'solved': solved, 'errors': errors, 'seconds': elapsed, 'captchas_per_second': processed / elapsed if elapsed else 0.0}
+
+        if self.accuracy_test and processed:
+            success_percentage = round((solved / processed) * 100, 5)
+            result = f'::Test::Ver{__version__}::Cap{processed}::Per{success_percentage}::'
+
+            with open(self.test_results, 'w', encoding='utf-8') as f:
+                print(result)
+                f.write(result)
+
+        return results
+
+    async def _adownload(self, session, semaphore, timeout):
+        """Requests the page with Amazon's captcha and downloads a random captcha."""
+
+        from .aio import fetch
+
+        content_type, captcha_page = await fetch(self.validate_captcha_url, timeout, session, semaphore)
+        captcha_link = self._extract_captcha_link(captcha_page.decode('utf-8', 'replace'))
+
+        content_type, content = await fetch(captcha_link, timeout, session, semaphore)
+
+        return captcha_link, content
+
+    async def astart(self, target, concurrency=CONCURRENT_FETCHES, executor=None, solvers=None, max_errors=None, report_every=REPORT_EVERY, timeout=120):
+        """
+        Asynchronous counterpart of `start`, collecting from a single event loop.
+
+        Download tasks fetch pages and images, bounded by a semaphore, and
+        feed a queue. Solver tasks take captchas off the queue, solve them in
+        an executor and write the images from a thread, so the loop never
+        blocks. Failed jobs are replaced with new ones, so exactly `target`
+        captchas are processed. Results are logged through `log`. Requires
+        aiohttp.
+
         Args:
             target (int): Number of captchas to be processed.
-            processes (int): Number of simultaneous processes.
+            concurrency (int, optional): Number of simultaneous requests.
+            executor (concurrent.futures.Executor, optional): Executor to
+                solve in, e.g. a `ProcessPoolExecutor` with a handful of
+                workers. Defaults to the shared thread pool of `aio`.
+            solvers (int, optional): Number of captchas being solved at once,
+                best matched to the workers of `executor`. Defaults to the
+                number of CPUs.
+            max_errors (int, optional): Number of failed downloads or solves
+                tolerated before giving up. Defaults to `target`.
+            report_every (int, optional): Number of processed captchas between
+                two progress reports. 0 disables them.
+            timeout (int, optional): Request timeout in seconds.
+
+        Returns:
+            dict: Number of processed, solved and failed captchas, elapsed
+                seconds and captchas per second.
+
+        Raises:
+            RuntimeError: If more than `max_errors` jobs failed.
 
         """
 
-        goal = list(range(target))
-        milestones = [goal[x: x + target // processes] for x in range(0, len(goal), target // processes)]
+        from .aio import _import_aiohttp, get_executor
+
+        aiohttp = _import_aiohttp()
+        loop = asyncio.get_running_loop()
+        executor = executor or get_executor()
+        solvers = solvers or os.cpu_count() or 1
+        max_errors = target if max_errors is None else max_errors
+
+        jobs = asyncio.Queue()
+        downloaded = asyncio.Queue(maxsize=concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+        finished = asyncio.Event()
+        state = {'processed': 0, 'solved': 0, 'errors': 0, 'failure': None}
+        started = time.perf_counter()
+
+        for job in range(target):
+            jobs.put_nowait(job)
+
+        def fail(e):
+            state['errors'] += 1
+
+            if state['errors'] > max_errors:
+                state['failure'] = RuntimeError(f'Collecting stopped after {state["errors"]} failed jobs, the last one failed with: {e!r}')
+                finished.set()
+
+            else:
+                jobs.put_nowait(None)
+
+        async def download(session):
+
+            while True:
+                await jobs.get()
+
+                try:
+                    download_started = time.perf_counter()
+                    captcha_link, content = await self._adownload(session, semaphore, timeout)
+
+                except Exception as e:
+                    fail(e)
+                    continue
 
-        jobs = list()
-        for j in range(processes):
-            p = multiprocessing.Process(target=self._distribute_collecting, args=(milestones[j], ))
-            jobs.append(p)
-            p.start()
+                await downloaded.put((captcha_link, content, time.perf_counter() - download_started))
 
-        for proc in jobs:
-            proc.join()
+        async def solve():
 
-        if self.accuracy_test:
-            with open(self.collector_logs, 'r', encoding='utf-8') as f:
-                output = f.readlines()
+            while True:
+                captcha_link, content, download_time = await downloaded.get()
 
-            all_captchas = len(output)
-            solved_captchas = len([i for i in output if 'Not solved' not in i])
-            success_percentage = round((solved_captchas / all_captchas) * 100, 5)
-            result = f'::Test::Ver{__version__}::Cap{all_captchas}::Per{success_percentage}::'
+                try:
+                    solution, png, solve_time = await loop.run_in_executor(executor, _solve_captcha, content, not self.accuracy_test)
+                    await loop.run_in_executor(None, self._store, captcha_link, solution, png, {'download': download_time, 'solve': solve_time})
+
+                except Exception as e:
+                    fail(e)
+                    continue
+
+                state['processed'] += 1
+                state['solved'] += solution != 'Not solved'
+
+                if report_every and (state['processed'] % report_every == 0 or state['processed'] == target):
+                    self._report(state['processed'], target, started)
+
+                if state['processed'] == target:
+                    finished.set()
+
+        self.log.open()
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+                tasks = [asyncio.ensure_future(download(session)) for i in range(min(concurrency, max(target, 1)))]
+                tasks.extend(asyncio.ensure_future(solve()) for i in range(solvers))
+
+                if target > 0:
+                    await finished.wait()
+
+                for task in tasks:
+                    task.cancel()
+
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        finally:
+            await loop.run_in_executor(None, self.log.close)
+
+        if state['failure'] is not None:
+            raise state['failure']
+
+        return self._finish(state['processed'], state['solved'], state['errors'], started)
+
+class AccuracyEvaluator(object):
+
+    def __init__(self, folder, test_results=None):
+        """
+        Initializes the AccuracyEvaluator instance.
+
+        Measures accuracy offline, on images labeled with their solutions,
+        e.g. the ones stored by `AmazonCaptchaCollector`. Files whose names
+        do not match `LABELED_IMAGE_PATTERN` are skipped.
+
+        Args:
+            folder (str): Folder with labeled images.
+            test_results (str, optional): File the test summary is written
+                to. Defaults to `test-results.log` inside the folder.
+
+        Raises:
+            NotFolderError: If the folder does not exist.
+
+        """
+
+        if not os.path.isdir(folder):
+            raise NotFolderError(folder)
+
+        self.folder = folder
+        self.test_results = test_results or os.path.join(folder, 'test-results.log')
+
+    def labeled_images(self):
+        """
+        Lists the labeled images of the folder.
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: Sorted pairs of image paths and
+                expected solutions.
+
+        """
+
+        return _labeled_images(self.folder)
+
+    def start(self, processes=None, chunksize=None, serial_threshold=None):
+        """
+        Solves every labeled image in a warm process pool, checking the labels.
+
+        Failures are broken down by their reason: a failed segmentation,
+        named after the `segment` outcome of `SolverStats`, unrecognised
+        letters or a wrong solution. Letters of every segmented captcha are
+        counted in the confusion table, a dash standing for an unrecognised
+        letter.
+
+        Args:
+            processes (int, optional): Number of worker processes. Defaults to
+                the number of CPUs.
+            chunksize (int, optional): Number of images sent to a worker at once.
+            serial_threshold (int, optional): Folders with fewer images are
+                evaluated in the calling process. Defaults to `SERIAL_THRESHOLD`
+                of `batch`.
+
+        Returns:
+            dict: Number of processed and solved captchas, accuracy in
+                percents, failures by reason, the confusion table as
+                expected letter -> solved letter -> count, elapsed seconds
+                and captchas per second.
+
+        """
+
+        from .batch import map_jobs, SERIAL_THRESHOLD
+
+        images = self.labeled_images()
+        processes = processes or os.cpu_count() or 1
+        serial_threshold = SERIAL_THRESHOLD if serial_threshold is None else serial_threshold
+        started = time.perf_counter()
+
+        evaluated = map_jobs(_evaluate_captcha, [path for path, expected in images], processes, chunksize, serial_threshold)
+
+        solved = 0
+        failures = dict()
+        confusion = dict()
+
+        for (path, expected), (letters, outcome) in zip(images, evaluated):
+
+            if letters is None:
+                reason = outcome
+
+            else:
+                for expected_letter, letter in zip(expected, letters):
+                    row = confusion.setdefault(expected_letter, dict())
+                    row[letter] = row.get(letter, 0) + 1
+
+                if letters == expected:
+                    solved += 1
+                    continue
+
+                reason = 'unrecognised_letters' if '-' in letters else 'wrong_solution'
+
+            failures[reason] = failures.get(reason, 0) + 1
+
+        elapsed = time.perf_counter() - started
+        processed = len(images)
+        accuracy = round((solved / processed) * 100, 5) if processed else 0.0
+
+        if processed:
+            result = f'::Test::Ver{__version__}::Cap{processed}::Per{accuracy}::'
 
             with open(self.test_results, 'w', encoding='utf-8') as f:
                 print(result)
                 f.write(result)
 
+        return {
+            'processed': processed, 'solved': solved, 'accuracy': accuracy, 'failures': failures,
+            'confusion': confusion, 'seconds': elapsed, 'captchas_per_second': processed / elapsed if elapsed else 0.0
+        }
+
+def ingest_training_data(source_folder, folder=TRAINING_DATA_FOLDER, max_segments=MAX_SEGMENTS):
+    """
+    Adds the letters of labeled images to the training data.
+
+    Every image whose name matches `LABELED_IMAGE_PATTERN` is segmented and
+    its letters are fingerprinted. Only the fingerprints that the training
+    data does not know yet are appended, as a single new segment, so the
+    cost grows with the new images rather than with the whole training data.
+    Once there are more than `max_segments` segments, they are compacted
+    into the letter files.
+
+    A letter whose fingerprint is already stored for the same letter is
+    redundant. One stored for a different letter, or labeled differently
+    by an earlier image of the same run, is a conflict and is not added.
+
+    The process-wide training index is not reloaded, restart the process
+    to solve with the new data.
+
+    Args:
+        source_folder (str): Folder with labeled images.
+        folder (str, optional): Training folder to be updated.
+        max_segments (int, optional): Number of segments kept before a
+            compaction.
+
+    Returns:
+        dict: Number of read images and added and redundant letters,
+            `conflicts` as dicts with the image, letter position, label and
+            stored letter, `skipped` names of images that could not be split
+            into their labels, the written `segment` or None, and whether
+            the training data was `compacted`.
+
+    Raises:
+        NotFolderError: If the source folder does not exist.
+
+    """
+
+    if not os.path.isdir(source_folder):
+        raise NotFolderError(source_folder)
+
+    index = open_training_index(folder)
+    images = _labeled_images(source_folder)
+
+    new = dict()
+    entries = dict()
+    redundant = 0
+    conflicts = list()
+    skipped = list()
+
+    for path, expected in images:
+        letters, outcome = extract_letters_with_outcome(monochrome(load_image(path)))
+
+        if outcome.startswith('failed.') or len(letters) != len(expected):
+            skipped.append(os.path.basename(path))
+            continue
+
+        for position, (letter, letter_data) in enumerate(zip(expected, letters)):
+            key = fingerprint(letter_data)
+            stored = index.get(key) or new.get(key)
+
+            if stored is None:
+                new[key] = letter
+                entries.setdefault(letter, list()).append(pseudo_binary(letter_data))
+
+            elif stored == letter:
+                redundant += 1
+
+            else:
+                conflicts.append({'image': os.path.basename(path), 'position': position, 'letter': letter, 'stored': stored})
+
+    if hasattr(index, 'close'):
+        index.close()
+
+    segment = write_segment(entries, folder) if entries else None
+    compacted = len(list_segments(folder)) > max_segments
+
+    if compacted:
+        compact_training_data(folder)
+
+    return {
+        'images': len(images), 'added': len(new), 'redundant': redundant, 'conflicts': conflicts,
+        'skipped': skipped, 'segment': segment, 'compacted': compacted
+    }
+
 #--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,593 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.engine
+~~~~~~~~~~~~~~~~~~~~
+
+This module contains SolverEngine, the reusable core behind AmazonCaptcha.
+
+An engine owns the loaded training index and solves images without keeping
+any per-image state, so a single engine can be shared between threads.
+
+Attributes:
+    MONOWEIGHT (int): The bigger this number - the thicker a monochromed picture
+    MAXIMUM_LETTER_LENGTH (int): Maximum letter length by X axis
+    MINIMUM_LETTER_LENGTH (int): Minimum letter length by X axis
+
+"""
+
+from .utils import column_projection, find_letter_boxes, extract_letter
+from .training import get_training_index, fingerprint
+
+from PIL import Image
+from io import BytesIO
+import threading
+import time
+import io
+
+#--------------------------------------------------------------------------------------------------------------
+
+MONOWEIGHT = 1
+MAXIMUM_LETTER_LENGTH = 33
+MINIMUM_LETTER_LENGTH = 14
+
+_MONOCHROME_TABLE = [0 if a <= MONOWEIGHT else 255 for a in range(256)]
+_BLANK_LETTER = bytes(200 * 70)
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+#--------------------------------------------------------------------------------------------------------------
+
+class _BufferReader(io.RawIOBase):
+    """Read-only file object over a buffer, so it can be decoded without copying it first."""
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        end = len(self._buffer) if size is None or size < 0 else self._position + size
+        chunk = bytes(self._buffer[self._position:end])
+        self._position += len(chunk)
+
+        return chunk
+
+    def readinto(self, b):
+        chunk = self._buffer[self._position:self._position + len(b)]
+        b[:len(chunk)] = chunk
+        self._position += len(chunk)
+
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._buffer)}[whence]
+        self._position = max(0, base + offset)
+
+        return self._position
+
+    def tell(self):
+        return self._position
+
+def is_decoded(img):
+    """
+    Tells if an image is given as pixels rather than as encoded bytes.
+
+    Args:
+        img: Captcha image in any form accepted by `load_image`.
+
+    Returns:
+        bool: True for PIL images and arrays, which have no raw bytes to
+            hash for the cache.
+
+    """
+
+    return isinstance(img, Image.Image) or hasattr(img, '__array_interface__')
+
+def read_image(img):
+    """
+    Reads raw bytes of an image that is not decoded yet.
+
+    Args:
+        img (str, bytes-like object or file object): Captcha image.
+
+    Returns:
+        bytes-like object: Raw image bytes. Buffers are returned as they
+            are, without being copied.
+
+    """
+
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return img
+
+    if hasattr(img, 'read'):
+        return img.read()
+
+    with open(img, 'rb') as f:
+        return f.read()
+
+def load_image(img):
+    """
+    Opens an image for solving.
+
+    JPEG images are decoded straight to grayscale. Images that are already
+    opened are returned as they are. Bytes-like objects are decoded in
+    place, and C-contiguous 2-D uint8 arrays, e.g. `numpy` ones, are wrapped
+    as grayscale images sharing their memory.
+
+    Args:
+        img (str, bytes-like object, file object, PIL.Image or array):
+            Captcha image.
+
+    Returns:
+        PIL.Image: Opened image.
+
+    Raises:
+        ValueError: If an array is not a 2-D uint8 one.
+
+    """
+
+    if isinstance(img, Image.Image):
+        return img
+
+    if hasattr(img, '__array_interface__'):
+        interface = img.__array_interface__
+
+        if len(interface['shape']) != 2 or interface['typestr'] != '|u1':
+            raise ValueError('Only 2-D uint8 arrays of grayscale pixels are supported.')
+
+        height, width = interface['shape']
+
+        if interface.get('strides') is None:
+            return Image.frombuffer('L', (width, height), img, 'raw', 'L', 0, 1)
+
+        return Image.fromarray(img)
+
+    if isinstance(img, bytes):
+        img = BytesIO(img)
+
+    elif isinstance(img, (bytearray, memoryview)):
+        img = _BufferReader(img)
+
+    img = Image.open(img, 'r')
+    img.draft('L', img.size)
+
+    return img
+
+def monochrome(img):
+    """
+    Makes a captcha pure monochrome.
+
+    Literally says: "for each pixel of an image turn codes 0, 1 to a 0,
+    while everything in range from 2 to 255 should be replaced with 255".
+    *All the numbers stay for color codes.
+
+    The threshold is applied as a single lookup table, without Python callbacks.
+
+    Args:
+        img (PIL.Image): Captcha image.
+
+    Returns:
+        PIL.Image: Monochromed captcha.
+
+    """
+
+    if img.mode != 'L':
+        img = img.convert('L')
+
+    return img.point(_MONOCHROME_TABLE)
+
+def segment_letters(data, width, projection=None):
+    """
+    Finds the X coords of every letter of a monochromed captcha.
+
+    Args:
+        data (bytes): Raw pixels of the monochromed captcha.
+        width (int): Width of the captcha.
+        projection (:obj:`list` of :obj:`int`, optional): Column projection
+            of the captcha, if it was already computed.
+
+    Returns:
+        :obj:`list` of :obj:`list`: X coords of the parts of the six letters,
+            OR None if the captcha could not be split into six letters. A
+            letter ending at the beginning of the image has two parts.
+
+    """
+
+    if projection is None:
+        projection = column_projection(data, width)
+
+    return _segment(projection)[0]
+
+def _segment(projection):
+    """Splits a captcha into letters, also naming the outcome for `stats`."""
+
+    letter_boxes = [[letter_box] for letter_box in find_letter_boxes(None, MAXIMUM_LETTER_LENGTH, projection)]
+
+    if len(letter_boxes) != 6 and len(letter_boxes) != 7:
+        return None, 'failed.letter_count'
+
+    if len(letter_boxes) == 6 and letter_boxes[0][0][1] - letter_boxes[0][0][0] < MINIMUM_LETTER_LENGTH:
+        return None, 'failed.narrow_first_letter'
+
+    if len(letter_boxes) == 7:
+        letter_boxes[6].extend(letter_boxes[0])
+        del letter_boxes[0]
+
+        return letter_boxes, 'wrapped_letter'
+
+    return letter_boxes, 'six_letters'
+
+def cut_letters(data, width, height, letter_boxes, projection=None):
+    """
+    Copies trimmed letters out of a monochromed captcha.
+
+    Args:
+        data (bytes): Raw pixels of the monochromed captcha.
+        width (int): Width of the captcha.
+        height (int): Height of the captcha.
+        letter_boxes (list): X coords of the letters, as returned by
+            `segment_letters`. None stands for a failed segmentation.
+        projection (:obj:`list` of :obj:`int`, optional): Column projection
+            of the captcha, if it was already computed.
+
+    Returns:
+        :obj:`list` of :obj:`bytes`: Raw pixels of the six letters.
+
+    """
+
+    if letter_boxes is None:
+        return [_BLANK_LETTER] * 6
+
+    if projection is None:
+        projection = column_projection(data, width)
+
+    return [extract_letter(data, width, height, boxes, projection)[1] for boxes in letter_boxes]
+
+def extract_letters(img):
+    """
+    Extracts letters from a monochromed captcha.
+
+    Letters are trimmed, and a letter ending at the beginning of the image
+    is merged, on the projections of a single image buffer. Only the final
+    letter pixels are copied out of it.
+
+    Args:
+        img (PIL.Image): Monochromed captcha.
+
+    Returns:
+        :obj:`list` of :obj:`bytes`: Raw pixels of the six letters.
+
+    """
+
+    return _extract_letters(img)[0]
+
+def extract_letters_with_outcome(img):
+    """
+    Extracts letters from a monochromed captcha, naming the outcome of the segmentation.
+
+    Args:
+        img (PIL.Image): Monochromed captcha.
+
+    Returns:
+        tuple: Raw pixels of the six letters, blank ones if the segmentation
+            failed, and the outcome counted by `SolverStats` under `segment`:
+            'six_letters', 'wrapped_letter' or a 'failed.' reason.
+
+    """
+
+    return _extract_letters(img)
+
+def _extract_letters(img, stats=None):
+    """Runs `extract_letters_with_outcome`, reporting its stages and the segmentation outcome to `stats`."""
+
+    clock = time.perf_counter
+    started = clock()
+    data = img.tobytes()
+    projection = column_projection(data, img.width)
+    letter_boxes, outcome = _segment(projection)
+    segmented = clock()
+    letters = cut_letters(data, img.width, img.height, letter_boxes, projection)
+
+    if stats is not None:
+        stats.stage('segment', segmented - started)
+        stats.stage('extract', clock() - segmented)
+        stats.count('segment.' + outcome)
+
+    return letters, outcome
+
+def classify(fingerprints, training_index):
+    """
+    Looks up the letters stored for fingerprints.
+
+    Args:
+        fingerprints (:obj:`list` of :obj:`bytes`): Letter fingerprints.
+        training_index: Object with `get(fingerprint)`, e.g. the one
+            returned by `training.get_training_index`.
+
+    Returns:
+        :obj:`list`: Letters, None for unrecognised ones.
+
+    """
+
+    return [training_index.get(letter_fingerprint) for letter_fingerprint in fingerprints]
+
+def format_solution(letters, devmode=False):
+    """
+    Joins classified letters into a solution.
+
+    Args:
+        letters (list): Letters, None for unrecognised ones.
+        devmode (bool, optional): If set to True, instead of 'Not solved',
+            unrecognised letters will be replaced with dashes.
+
+    Returns:
+        str: Solution.
+
+    """
+
+    if None in letters and not devmode:
+        return 'Not solved'
+
+    return ''.join(letter or '-' for letter in letters)
+
+def format_devmode_solution(solution, devmode=False):
+    """
+    Formats a solution kept in dev mode, e.g. a cached one, like `format_solution`.
+
+    Args:
+        solution (str): Solution with dashes for unrecognised letters.
+        devmode (bool, optional): If set to True, the solution is returned as
+            it is, otherwise a solution with dashes becomes 'Not solved'.
+
+    Returns:
+        str: Solution.
+
+    """
+
+    if '-' in solution and not devmode:
+        return 'Not solved'
+
+    return solution
+
+def set_default_engine(engine):
+    """
+    Replaces the process-wide engine, e.g. with one that has a cache.
+
+    Args:
+        engine (SolverEngine): Engine to be used by default.
+
+    """
+
+    global _default_engine
+
+    with _default_engine_lock:
+        _default_engine = engine
+
+def get_default_engine():
+    """
+    Returns the process-wide engine, creating it on the first call.
+
+    Returns:
+        SolverEngine: Engine over the process-wide training index.
+
+    """
+
+    global _default_engine
+
+    if _default_engine is None:
+        with _default_engine_lock:
+            if _default_engine is None:
+                _default_engine = SolverEngine()
+
+    return _default_engine
+
+#--------------------------------------------------------------------------------------------------------------
+
+class SolverEngine(object):
+
+    def __init__(self, training_index=None, cache=None, stats=None):
+        """
+        Initializes the SolverEngine instance.
+
+        Args:
+            training_index (optional): Object with `get(fingerprint)` returning
+                a letter or None. Defaults to the process-wide training index.
+            cache (cache.SolutionCache, optional): Opt-in cache of solutions.
+            stats (stats.SolverStats, optional): Opt-in receiver of stage
+                durations and outcome counters.
+
+        """
+
+        self.training_index = training_index if training_index is not None else get_training_index()
+        self.cache = cache
+        self.stats = stats
+
+    def classify_image(self, img):
+        """
+        Runs every solving stage on an image, bypassing the cache.
+
+        Args:
+            img (str, bytes-like object, file object, PIL.Image or array):
+                Captcha image.
+
+        Returns:
+            :obj:`list`: Letters, None for unrecognised ones.
+
+        """
+
+        return self._classify(self.fingerprint_image(img))
+
+    def fingerprint_image(self, img):
+        """
+        Decodes, segments and fingerprints an image.
+
+        Segmentation and extraction are shared with `extract_letters`, every
+        stage is reported to `stats` when the engine has them.
+
+        Args:
+            img (str, bytes-like object, file object, PIL.Image or array):
+                Captcha image.
+
+        Returns:
+            :obj:`list` of :obj:`bytes`: Fingerprints of the six letters.
+
+        """
+
+        clock = time.perf_counter
+        started = clock()
+        img = load_image(img)
+        img.load()
+        decoded = clock()
+        img = monochrome(img)
+        monochromed = clock()
+        letters = _extract_letters(img, self.stats)[0]
+        extracted = clock()
+        fingerprints = [fingerprint(letter) for letter in letters]
+
+        if self.stats is not None:
+            self.stats.stage('decode', decoded - started)
+            self.stats.stage('monochrome', monochromed - decoded)
+            self.stats.stage('fingerprint', clock() - extracted)
+
+        return fingerprints
+
+    def _classify(self, fingerprints):
+        """Runs `classify_fingerprints`, reporting it to `stats`."""
+
+        if self.stats is None:
+            return self.classify_fingerprints(fingerprints)
+
+        started = time.perf_counter()
+        letters = self.classify_fingerprints(fingerprints)
+
+        self.stats.stage('classify', time.perf_counter() - started)
+        self.stats.count('letters.found', len(letters) - letters.count(None))
+        self.stats.count('letters.unrecognised', letters.count(None))
+
+        return letters
+
+    def classify_fingerprints(self, fingerprints):
+        """
+        Looks up the letters stored for fingerprints of any number of captchas.
+
+        Subclasses may override this method to classify a whole batch at once.
+
+        Args:
+            fingerprints (:obj:`list` of :obj:`bytes`): Letter fingerprints.
+
+        Returns:
+            :obj:`list`: Letters, None for unrecognised ones.
+
+        """
+
+        return classify(fingerprints, self.training_index)
+
+    def solve_batch(self, images, devmode=False):
+        """
+        Solves a batch of captchas in the calling thread, preserving their order.
+
+        Letters of every captcha are classified in a single
+        `classify_fingerprints` call. With a cache, the batch is looked up
+        at once and only the misses are decoded.
+
+        Args:
+            images (iterable): Paths, bytes-like objects or file objects.
+            devmode (bool, optional): If set to True, instead of 'Not solved',
+                unrecognised letters will be replaced with dashes.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Solutions in the order of the images.
+
+        """
+
+        images = [read_image(img) for img in images]
+        solutions = [None] * len(images)
+        keys_list = None
+
+        if self.cache is not None:
+            from .cache import cache_keys
+
+            keys_list = [cache_keys(img) for img in images]
+            solutions = self.cache.lookup_many(keys_list)
+
+        misses = [position for position, solution in enumerate(solutions) if solution is None]
+        fingerprints = [key for position in misses for key in self.fingerprint_image(images[position])]
+        letters = self._classify(fingerprints)
+
+        for number, position in enumerate(misses):
+            solutions[position] = format_solution(letters[number * 6:number * 6 + 6], devmode=True)
+
+        if self.cache is not None:
+            self.cache.store_many([(keys_list[position], solutions[position]) for position in misses])
+
+        if self.stats is not None:
+            not_solved = sum('-' in solution for solution in solutions)
+            self.stats.count('solve.solved', len(solutions) - not_solved)
+            self.stats.count('solve.not_solved', not_solved)
+
+            if self.cache is not None:
+                self.stats.count('cache.hit', len(solutions) - len(misses))
+                self.stats.count('cache.miss', len(misses))
+
+        return [format_devmode_solution(solution, devmode) for solution in solutions]
+
+    def solve(self, img, devmode=False):
+        """
+        Solves a captcha.
+
+        Nothing but the opt-in cache is shared between calls, so it is safe
+        to call this method from many threads at once. On a cache hit the
+        image is not decoded at all.
+
+        Args:
+            img (str, bytes-like object, file object, PIL.Image or array):
+                Captcha image. Already decoded images bypass the cache, since
+                there are no raw bytes to hash.
+            devmode (bool, optional): If set to True, instead of 'Not solved',
+                unrecognised letters will be replaced with dashes.
+
+        Returns:
+            str: Solution.
+
+        """
+
+        if self.stats is None:
+            return self._solve(img, devmode)
+
+        started = time.perf_counter()
+        solution = self._solve(img, True)
+
+        self.stats.stage('solve', time.perf_counter() - started)
+        self.stats.count('solve.not_solved' if '-' in solution else 'solve.solved')
+
+        return format_devmode_solution(solution, devmode)
+
+    def _solve(self, img, devmode):
+        """Solves a captcha, looking it up in the cache first."""
+
+        if self.cache is None or is_decoded(img):
+            return format_solution(self.classify_image(img), devmode)
+
+        from .cache import cache_keys
+
+        img = read_image(img)
+        keys = cache_keys(img)
+        solution = self.cache.lookup(keys)
+
+        if self.stats is not None:
+            self.stats.count('cache.hit' if solution is not None else 'cache.miss')
+
+        if solution is None:
+            solution = format_solution(self.classify_image(img), devmode=True)
+            self.cache.store(keys, solution)
+
+        return format_devmode_solution(solution, devmode)
+
+#--------------------------------------------------------------------------------------------------------------
@@ -35,4 +35,17 @@ class NotFolderError(Exception):
     def __str__(self):
         return f'"{self.path}" {self.message}'
 
+class TrainingDataError(Exception):
+    """
+    Given path, which was supposed to be the path to the training data,
+    cannot be read or written as such.
+    """
+
+    def __init__(self, path, message='is not valid training data.'):
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        return f'"{self.path}" {self.message}'
+
 #--------------------------------------------------------------------------------------------------------------
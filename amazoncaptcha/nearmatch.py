@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.nearmatch
+~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the near-match index used when a letter's fingerprint
+is not in the training data exactly.
+
+A single unknown letter makes the whole captcha 'Not solved'. The near-match
+index looks such letters up by the Hamming distance between their pixels and
+the pixels of the training letters. Training letters are bucketed by their
+pixel count, since the training data does not record letter dimensions, and
+every bucket is searched through a BK-tree, so a lookup only visits a small
+part of it. Exact matches never reach the trees.
+
+Attributes:
+    MAX_DISTANCE (int): Default number of differing pixels a near match
+        may have.
+
+"""
+
+from .training import TRAINING_DATA_FOLDER, get_training_index, load_training_data
+
+import threading
+
+#--------------------------------------------------------------------------------------------------------------
+
+MAX_DISTANCE = 16
+
+#--------------------------------------------------------------------------------------------------------------
+
+def hamming_distance(first, second):
+    """
+    Counts the bits that differ between two bit-packed letters.
+
+    Args:
+        first (int): Pixels of a letter, packed into an integer.
+        second (int): Pixels of a letter of the same size, packed into an integer.
+
+    Returns:
+        int: Number of differing pixels.
+
+    """
+
+    return bin(first ^ second).count('1')
+
+class BKTree(object):
+
+    def __init__(self):
+        """
+        Initializes an empty BKTree instance over the Hamming distance.
+
+        Every node is a list of its pixels, its letter and a dict of children
+        keyed by their distance to the node.
+        """
+
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, pixels, letter):
+        """
+        Adds a letter to the tree.
+
+        Args:
+            pixels (int): Pixels of the letter, packed into an integer.
+            letter (str): The letter.
+
+        """
+
+        self.size += 1
+
+        if self.root is None:
+            self.root = [pixels, letter, dict()]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(pixels, node[0])
+            if distance in node[2]:
+                node = node[2][distance]
+
+            else:
+                node[2][distance] = [pixels, letter, dict()]
+                return
+
+    def nearest(self, pixels, max_distance=MAX_DISTANCE):
+        """
+        Finds the closest letter within a distance.
+
+        Ties are broken in favour of the letter that comes first alphabetically.
+
+        Args:
+            pixels (int): Pixels of the letter to be looked up.
+            max_distance (int, optional): Number of differing pixels allowed.
+
+        Returns:
+            tuple: The letter and its distance OR None if nothing is close enough.
+
+        """
+
+        best = None
+        nodes = [self.root] if self.root is not None else []
+
+        while nodes:
+            node = nodes.pop()
+            distance = hamming_distance(pixels, node[0])
+
+            if distance <= max_distance and (best is None or (distance, node[1]) < best[::-1]):
+                best = (node[1], distance)
+                max_distance = distance
+
+            nodes.extend(child for edge, child in node[2].items() if distance - max_distance <= edge <= distance + max_distance)
+
+        return best
+
+#--------------------------------------------------------------------------------------------------------------
+
+class NearMatchIndex(object):
+
+    def __init__(self, max_distance=MAX_DISTANCE, exact_index=None, folder=TRAINING_DATA_FOLDER):
+        """
+        Initializes the NearMatchIndex instance.
+
+        The BK-trees are built from the JSON training files on the first
+        lookup that misses the exact index.
+
+        Args:
+            max_distance (int, optional): Number of differing pixels a near
+                match may have.
+            exact_index (optional): Object with `get(fingerprint)` tried first.
+                Defaults to the process-wide training index.
+            folder (str, optional): Folder with training files.
+
+        """
+
+        self.max_distance = max_distance
+        self.exact_index = exact_index if exact_index is not None else get_training_index()
+        self.folder = folder
+
+        self._trees = None
+        self._trees_lock = threading.Lock()
+
+    def _get_trees(self):
+        """Builds a BK-tree for every pixel count, once."""
+
+        if self._trees is None:
+            with self._trees_lock:
+                if self._trees is None:
+                    trees = dict()
+                    for key, letter in load_training_data(self.folder).items():
+                        trees.setdefault(key[:4], BKTree()).add(int.from_bytes(key[4:], 'big'), letter)
+
+                    self._trees = trees
+
+        return self._trees
+
+    def nearest(self, key):
+        """
+        Finds the closest training letter of the same pixel count.
+
+        Args:
+            key (bytes): Fingerprint to be looked up.
+
+        Returns:
+            tuple: The letter and its distance OR None if nothing is within
+                `max_distance`.
+
+        """
+
+        tree = self._get_trees().get(key[:4])
+        if tree is None:
+            return None
+
+        return tree.nearest(int.from_bytes(key[4:], 'big'), self.max_distance)
+
+    def get(self, key, default=None):
+        """
+        Looks up the letter stored for a fingerprint, falling back to the
+        closest one.
+
+        Args:
+            key (bytes): Fingerprint to be looked up.
+            default (optional): Returned if there is no close enough letter.
+
+        Returns:
+            str: The letter OR `default`.
+
+        """
+
+        letter = self.exact_index.get(key)
+        if letter is not None:
+            return letter
+
+        match = self.nearest(key)
+
+        return match[0] if match is not None else default
+
+#--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.pipeline
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the solving stages of amazoncaptcha as separate
+functions with plain-data inputs and outputs.
+
+    bitmap = preprocess(img)                   # (pixels, width, height)
+    letter_boxes = segment(bitmap)             # X coords of the six letters
+    fingerprints = fingerprint_letters(bitmap, letter_boxes)
+    letters = classify(fingerprints)           # letters, None if unknown
+    solution = join_letters(letters)
+
+Every intermediate result is made of bytes, ints, lists and tuples, so it
+can be pickled and sent to another process. Fingerprints are a few hundred
+bytes each, and `encode_fingerprints` turns them into JSON-friendly strings
+to send them between nodes instead of the images.
+
+"""
+
+from .engine import load_image, monochrome, segment_letters, cut_letters, format_solution, get_default_engine
+from .training import fingerprint
+
+import base64
+
+#--------------------------------------------------------------------------------------------------------------
+
+def preprocess(img):
+    """
+    Decodes and monochromes a captcha.
+
+    Args:
+        img (str, bytes, file object or PIL.Image): Captcha image.
+
+    Returns:
+        tuple: Raw pixels of the monochromed captcha, 0 standing for ink,
+            followed by its width and height.
+
+    """
+
+    img = monochrome(load_image(img))
+
+    return img.tobytes(), img.width, img.height
+
+def segment(bitmap):
+    """
+    Splits a preprocessed captcha into letters.
+
+    Args:
+        bitmap (tuple): Pixels, width and height, as returned by `preprocess`.
+
+    Returns:
+        :obj:`list` of :obj:`list`: X coords of the parts of the six letters,
+            OR None if the captcha could not be split into six letters.
+
+    """
+
+    data, width, height = bitmap
+
+    return segment_letters(data, width)
+
+def fingerprint_letters(bitmap, letter_boxes):
+    """
+    Cuts the letters out of a preprocessed captcha and fingerprints them.
+
+    Args:
+        bitmap (tuple): Pixels, width and height, as returned by `preprocess`.
+        letter_boxes (list): X coords of the letters, as returned by `segment`.
+
+    Returns:
+        :obj:`list` of :obj:`bytes`: Fingerprints of the six letters. If the
+            segmentation failed, they match no letter.
+
+    """
+
+    data, width, height = bitmap
+
+    return [fingerprint(letter) for letter in cut_letters(data, width, height, letter_boxes)]
+
+def classify(fingerprints, engine=None):
+    """
+    Looks up the letters of any number of fingerprints at once.
+
+    Args:
+        fingerprints (:obj:`list` of :obj:`bytes`): Letter fingerprints,
+            possibly of many captchas.
+        engine (engine.SolverEngine, optional): Engine to classify with.
+            Defaults to the process-wide engine.
+
+    Returns:
+        :obj:`list`: Letters, None for unrecognised ones.
+
+    """
+
+    return (engine or get_default_engine()).classify_fingerprints(list(fingerprints))
+
+def join_letters(letters, devmode=False):
+    """
+    Joins the letters of a single captcha into a solution.
+
+    Args:
+        letters (list): Six letters, None for unrecognised ones.
+        devmode (bool, optional): If set to True, instead of 'Not solved',
+            unrecognised letters will be replaced with dashes.
+
+    Returns:
+        str: Solution.
+
+    """
+
+    return format_solution(letters, devmode)
+
+def encode_fingerprints(fingerprints):
+    """
+    Turns fingerprints into strings, e.g. to send them as JSON.
+
+    Args:
+        fingerprints (:obj:`list` of :obj:`bytes`): Letter fingerprints.
+
+    Returns:
+        :obj:`list` of :obj:`str`: Base64-encoded fingerprints.
+
+    """
+
+    return [base64.b64encode(key).decode('ascii') for key in fingerprints]
+
+def decode_fingerprints(encoded):
+    """
+    Turns strings made by `encode_fingerprints` back into fingerprints.
+
+    Args:
+        encoded (:obj:`list` of :obj:`str`): Base64-encoded fingerprints.
+
+    Returns:
+        :obj:`list` of :obj:`bytes`: Letter fingerprints.
+
+    """
+
+    return [base64.b64decode(key) for key in encoded]
+
+#--------------------------------------------------------------------------------------------------------------
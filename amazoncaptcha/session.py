@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.session
+~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the shared `requests.Session` used by `fromlink` and
+the collector.
+
+A session keeps connections alive between requests, so consecutive captcha
+pages and images skip the TCP and TLS handshakes. Transient errors are
+retried with an exponential backoff. Every process gets its own session.
+
+Attributes:
+    POOL_SIZE (int): Number of connections kept alive per host.
+    RETRIES (int): Number of retries for transient errors.
+    BACKOFF_FACTOR (float): Backoff factor between retries, in seconds.
+    RETRY_STATUSES (tuple of int): Response statuses that are retried.
+
+"""
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+import requests
+import os
+
+#--------------------------------------------------------------------------------------------------------------
+
+POOL_SIZE = 10
+RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+#--------------------------------------------------------------------------------------------------------------
+
+def create_session(pool_size=POOL_SIZE, retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Creates a keep-alive session with a retry policy.
+
+    Args:
+        pool_size (int, optional): Number of connections kept alive per host.
+        retries (int, optional): Number of retries for transient errors.
+        backoff_factor (float, optional): Backoff factor between retries.
+
+    Returns:
+        requests.Session: Configured session.
+
+    """
+
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+def get_session():
+    """
+    Returns the session of the current process, creating it on the first call.
+
+    A process forked from another one does not reuse the parent's connections.
+
+    Returns:
+        requests.Session: Shared session.
+
+    """
+
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session, _session_pid = create_session(), os.getpid()
+
+    return _session
+
+def set_session(session):
+    """
+    Replaces the session of the current process.
+
+    Args:
+        session (requests.Session): Session to be shared, e.g. one returned
+            by `create_session` with a bigger pool.
+
+    """
+
+    global _session, _session_pid
+
+    with _session_lock:
+        _session, _session_pid = session, os.getpid()
+
+#--------------------------------------------------------------------------------------------------------------
@@ -6,66 +6,113 @@ amazoncaptcha.solver
 
 This module contains AmazonCaptcha instance and all the requiries for it.
 
+AmazonCaptcha is a per-image wrapper over `engine.SolverEngine`, which does
+the actual solving.
+
 Attributes:
-    MONOWEIGHT (int): The bigger this number - the thicker a monochromed picture
-    MAXIMUM_LETTER_LENGTH (int): Maximum letter length by X axis
-    MINIMUM_LETTER_LENGTH (int): Minimum letter length by X axis
     SUPPORTED_CONTENT_TYPES (list of str): Used when requesting a captcha url
         to check if Content-Type in the headers is valid
 
 """
 
-from .utils import cut_the_white, merge_horizontally, find_letter_boxes
+from .engine import MONOWEIGHT, MAXIMUM_LETTER_LENGTH, MINIMUM_LETTER_LENGTH
+from .engine import read_image, load_image, is_decoded, monochrome, extract_letters, classify, format_solution, format_devmode_solution
+from .engine import get_default_engine
+from .training import TRAINING_DATA_FOLDER, get_alphabet, fingerprint
 from .exceptions import ContentTypeError
 
-from PIL import Image, ImageChops
+from PIL import Image
 from io import BytesIO
 import warnings
-import requests
-import json
-import zlib
-import os
-
-try:
-    from selenium.webdriver.common.by import By
-except:
-    By = None
+import time
 
 #--------------------------------------------------------------------------------------------------------------
 
-MONOWEIGHT = 1
-MAXIMUM_LETTER_LENGTH = 33
-MINIMUM_LETTER_LENGTH = 14
 SUPPORTED_CONTENT_TYPES = ['image/jpeg']
 
 #--------------------------------------------------------------------------------------------------------------
 
 class AmazonCaptcha(object):
 
-    def __init__(self, img, image_link=None, devmode=False):
+    def __init__(self, img, image_link=None, devmode=False, engine=None):
         """
         Initializes the AmazonCaptcha instance.
 
         Args:
-            img (str or io.BytesIO): Path to an input image OR an instance
-                of BytesIO representing this image.
+            img (str, bytes-like object, file object, PIL.Image or array):
+                Path to an input image, its raw bytes in `bytes`, `bytearray`
+                or `memoryview`, a file object, an already opened image OR
+                a 2-D uint8 array of grayscale pixels. Buffers and arrays
+                are used in place, without being copied or re-encoded.
             image_link (str, optional): Used if `AmazonCaptcha` was created
                 using `fromdriver` class method. Defaults to None.
             devmode (bool, optional): If set to True, instead of 'Not solved',
                 unrecognised letters will be replaced with dashes.
+            engine (SolverEngine, optional): Engine used to solve the captcha.
+                Defaults to the process-wide engine.
 
         """
 
-        self.img = Image.open(img, 'r')
         self._image_link = image_link
         self.devmode = devmode
+        self.engine = engine or get_default_engine()
+
+        self._data = None
+        if self.engine.cache is not None and not is_decoded(img):
+            img = self._data = read_image(img)
+
+        self.img = load_image(img)
 
         self.letters = dict()
         self.result = dict()
 
-        package_directory_path = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
-        self.training_data_folder = os.path.join(package_directory_path, 'training_data')
-        self.alphabet = [filename.split('.')[0] for filename in os.listdir(self.training_data_folder)]
+        self.training_data_folder = TRAINING_DATA_FOLDER
+
+    @property
+    def img(self):
+        """
+        Captcha image, monochromed once the captcha is solved.
+
+        The engine solves on its own copy, so the image is only monochromed
+        when it is read after solving.
+
+        """
+
+        if self._monochrome_pending:
+            self._monochrome_pending = False
+            self._img = monochrome(self._img)
+
+        return self._img
+
+    @img.setter
+    def img(self, img):
+        self._img = img
+        self._monochrome_pending = False
+
+    @property
+    def letters(self):
+        """
+        Fingerprints of the letters by their places, once the captcha is solved.
+
+        They are extracted from the image when they are read, so a cache hit
+        still skips decoding.
+
+        """
+
+        if self._letters is None:
+            self._letters = {str(k): fingerprint(v) for k, v in zip(range(1, 7), extract_letters(self.img))}
+
+        return self._letters
+
+    @letters.setter
+    def letters(self, letters):
+        self._letters = letters
+
+    @property
+    def alphabet(self):
+        """Letters that have training data."""
+
+        return get_alphabet(self.training_data_folder)
 
     @property
     def image_link(self):
@@ -92,49 +139,33 @@ class AmazonCaptcha(object):
         *All the numbers stay for color codes.
         """
 
-        self.img = self.img.convert('L')
-        self.img = Image.eval(self.img, lambda a: 0 if a <= MONOWEIGHT else 255)
+        self.img = monochrome(self.img)
 
     def _find_letters(self):
         """
         Extracts letters from an image using found letter boxes.
 
-        Populates 'self.letters' with extracted letters being PIL.Image instances.
+        Populates 'self.letters' with raw pixels of extracted letters.
         """
 
-        letter_boxes = find_letter_boxes(self.img, MAXIMUM_LETTER_LENGTH)
-        letters = [self.img.crop((letter_box[0], 0, letter_box[1], self.img.height)) for letter_box in letter_boxes]
-
-        if (len(letters) == 6 and letters[0].width < MINIMUM_LETTER_LENGTH) or (len(letters) != 6 and len(letters) != 7):
-            letters = [Image.new('L', (200, 70)) for i in range(6)]
-
-        if len(letters) == 7:
-            letters[6] = merge_horizontally(letters[6], letters[0])
-            del letters[0]
-
-        letters = [cut_the_white(letter) for letter in letters]
-        self.letters = {str(k): v for k, v in zip(range(1, 7), letters)}
+        self.letters = {str(k): v for k, v in zip(range(1, 7), extract_letters(self.img))}
 
     def _save_letters(self):
         """
-        Transforms separated letters into pseudo binary.
+        Transforms separated letters into fingerprints.
 
-        Populates 'self.letters' with pseudo binaries.
+        Populates 'self.letters' with fingerprints.
         """
 
         for place, letter in self.letters.items():
-            letter_data = list(letter.getdata())
-            letter_data_string = ''.join(['1' if pix == 0 else '0' for pix in letter_data])
-
-            pseudo_binary = str(zlib.compress(letter_data_string.encode('utf-8')))
-            self.letters[place] = pseudo_binary
+            self.letters[place] = fingerprint(letter)
 
     def _translate(self):
         """
-        Finds patterns to extracted pseudo binary strings from data folder.
+        Finds letters stored for the extracted fingerprints.
 
-        Literally says: "for each pseudo binary scan every stored letter
-        pattern and find a match".
+        Literally says: "for each fingerprint look up the letter it is
+        stored for in the engine's training index".
 
         Returns:
             str: a solution if there is one OR
@@ -143,27 +174,18 @@ class AmazonCaptcha(object):
 
         """
 
-        for place, pseudo_binary in self.letters.items():
-            for letter in self.alphabet:
-
-                with open(os.path.join(self.training_data_folder, letter + '.json'), 'r', encoding = 'utf-8') as js:
-                    data = json.loads(js.read())
+        letters = classify(list(self.letters.values()), self.engine.training_index)
+        self.result = {place: letter or '-' for place, letter in zip(self.letters, letters)}
 
-                if pseudo_binary in data:
-                    self.result[place] = letter
-                    break
-
-            else:
-                self.result[place] = '-'
-
-                if not self.devmode:
-                    return 'Not solved'
-
-        return ''.join(self.result.values())
+        return format_solution(letters, self.devmode)
 
     def solve(self, keep_logs=False, logs_path='not-solved-captcha.log'):
         """
-        Runs the sequence of solving a captcha.
+        Runs the sequence of solving a captcha with the engine.
+
+        Populates `result` with the letters by their places, dashes standing
+        for unrecognised ones. `letters` and the monochromed `img` are
+        available afterwards too.
 
         Args:
             keep_logs (bool): Not solved captchas will be logged if True.
@@ -176,11 +198,13 @@ class AmazonCaptcha(object):
 
         """
 
-        self._monochrome()
-        self._find_letters()
-        self._save_letters()
+        solution = self.engine.solve(self._img if self._data is None else self._data, True)
+
+        self.result = {str(k): letter for k, letter in zip(range(1, 7), solution)}
+        self.letters = None
+        self._monochrome_pending = True
 
-        solution = self._translate()
+        solution = format_devmode_solution(solution, self.devmode)
 
         if solution == 'Not solved' and keep_logs and self.image_link:
 
@@ -189,11 +213,73 @@ class AmazonCaptcha(object):
 
         return solution
 
+    async def asolve(self, keep_logs=False, logs_path='not-solved-captcha.log', executor=None):
+        """
+        Runs the sequence of solving a captcha off the event loop.
+
+        Args:
+            keep_logs (bool): Not solved captchas will be logged if True.
+                Defaults to False.
+            logs_path (str): Path to the file where not solved captcha
+                links will be stored. Defaults to "not-solved-captcha.log".
+            executor (concurrent.futures.Executor, optional): Executor to
+                solve in. Defaults to the shared thread pool of `aio`.
+                The instance is solved in place, so it must be a thread
+                executor.
+
+        Returns:
+            str: Result of the sequence.
+
+        Raises:
+            TypeError: If `executor` is a process pool.
+
+        """
+
+        from concurrent.futures import ProcessPoolExecutor
+        from .aio import run_in_executor
+
+        if isinstance(executor, ProcessPoolExecutor):
+            raise TypeError('asolve fills the instance in place and cannot run in a ProcessPoolExecutor, use a thread executor or solve_many.')
+
+        return await run_in_executor(self.solve, keep_logs, logs_path, executor=executor)
+
+    @classmethod
+    def solve_many(cls, images, devmode=False, processes=None, chunksize=None, serial_threshold=None):
+        """
+        Solves a batch of captchas over a warm pool of worker processes.
+
+        The pool is created on the first call and reused afterwards, every
+        worker loads the training index once. Small batches are solved in
+        the calling process.
+
+        Args:
+            images (iterable): Paths, bytes-like objects or file objects.
+            devmode (bool, optional): If set to True, instead of 'Not solved',
+                unrecognised letters will be replaced with dashes.
+            processes (int, optional): Number of worker processes. Defaults
+                to the number of CPUs.
+            chunksize (int, optional): Number of captchas sent to a worker
+                at once.
+            serial_threshold (int, optional): Batches smaller than this are
+                solved serially. Defaults to `batch.SERIAL_THRESHOLD`.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Solutions in the order of the images.
+
+        """
+
+        from .batch import solve_many, SERIAL_THRESHOLD
+
+        if serial_threshold is None:
+            serial_threshold = SERIAL_THRESHOLD
+
+        return solve_many(images, devmode, processes, chunksize, serial_threshold)
+
     @classmethod
-    def fromdriver(cls, driver, devmode=False):
+    def fromdriver(cls, driver, devmode=False, engine=None):
         """
-        Takes a screenshot from your webdriver, crops the captcha, and stores
-        it into bytes array, which is then used to create an AmazonCaptcha instance.
+        Takes a screenshot from your webdriver and crops the captcha, which
+        is then used to create an AmazonCaptcha instance without re-encoding.
 
         This also means avoiding any local savings.
 
@@ -201,12 +287,16 @@ class AmazonCaptcha(object):
             driver (selenium.webdriver.*): Webdriver with opened captcha page.
             devmode (bool, optional): If set to True, instead of 'Not solved',
                 unrecognised letters will be replaced with dashes.
+            engine (SolverEngine, optional): Engine used to solve the captcha.
+                Defaults to the process-wide engine.
 
         Returns:
             AmazonCaptcha: Instance created based on webdriver.
 
         """
 
+        from selenium.webdriver.common.by import By
+
         png = driver.get_screenshot_as_png()
         element = driver.find_element(By.TAG_NAME, 'img')
         image_link = element.get_attribute('src')
@@ -221,17 +311,13 @@ class AmazonCaptcha(object):
         img = Image.open(BytesIO(png))
         img = img.crop((left, top, right, bottom))
 
-        bytes_array = BytesIO()
-        img.save(bytes_array, format='PNG')
-        image_bytes_array = BytesIO(bytes_array.getvalue())
-
-        return cls(image_bytes_array, image_link, devmode)
+        return cls(img, image_link, devmode, engine)
 
     @classmethod
-    def fromlink(cls, image_link, devmode=False, timeout=120):
+    def fromlink(cls, image_link, devmode=False, timeout=120, session=None, engine=None):
         """
-        Requests the given link and stores the content of the response
-        as `io.BytesIO` that is then used to create AmazonCaptcha instance.
+        Requests the given link and creates AmazonCaptcha instance straight
+        from the content of the response.
 
         This also means avoiding any local savings.
 
@@ -240,6 +326,11 @@ class AmazonCaptcha(object):
             devmode (bool, optional): If set to True, instead of 'Not solved',
                 unrecognised letters will be replaced with dashes.
             timeout (int, optional): Requests timeout.
+            session (requests.Session, optional): Session to use instead of
+                the shared keep-alive one.
+            engine (SolverEngine, optional): Engine used to solve the captcha,
+                which also gets the download time. Defaults to the
+                process-wide engine.
 
         Returns:
             AmazonCaptcha: Instance created based on the image link.
@@ -250,13 +341,68 @@ class AmazonCaptcha(object):
 
         """
 
-        response = requests.get(image_link, timeout=timeout)
+        if session is None:
+            from .session import get_session
+            session = get_session()
+
+        engine = engine or get_default_engine()
+        stats = engine.stats
+        started = time.perf_counter()
+
+        response = session.get(image_link, timeout=timeout)
+
+        if stats is not None:
+            stats.stage('download', time.perf_counter() - started)
 
         if response.headers['Content-Type'] not in SUPPORTED_CONTENT_TYPES:
             raise ContentTypeError(response.headers['Content-Type'])
 
-        image_bytes_array = BytesIO(response.content)
+        return cls(response.content, image_link, devmode, engine)
+
+    @classmethod
+    async def afromlink(cls, image_link, devmode=False, timeout=120, session=None, engine=None):
+        """
+        Asynchronous counterpart of `fromlink`.
+
+        Requests the given link through a pooled keep-alive session, bounded
+        by `aio.CONCURRENCY` simultaneous requests per event loop. The pooled
+        session is closed when `asyncio.run` shuts the loop down, other loops
+        must await `aio.close_session()` before they are closed.
+
+        Args:
+            link (str): Link to Amazon's captcha image.
+            devmode (bool, optional): If set to True, instead of 'Not solved',
+                unrecognised letters will be replaced with dashes.
+            timeout (int, optional): Request timeout.
+            session (aiohttp.ClientSession, optional): Session to use instead
+                of the pooled one.
+            engine (SolverEngine, optional): Engine used to solve the captcha,
+                which also gets the download time. Defaults to the
+                process-wide engine.
+
+        Returns:
+            AmazonCaptcha: Instance created based on the image link.
+
+        Raises:
+            ContentTypeError: If response headers contain unsupported
+                content type.
+
+        """
+
+        from .aio import fetch
+
+        engine = engine or get_default_engine()
+        stats = engine.stats
+        started = time.perf_counter()
+
+        content_type, content = await fetch(image_link, timeout, session)
+
+        if stats is not None:
+            stats.stage('download', time.perf_counter() - started)
+
+        if content_type not in SUPPORTED_CONTENT_TYPES:
+            raise ContentTypeError(content_type)
 
-        return cls(image_bytes_array, image_link, devmode)
+        return cls(content, image_link, devmode, engine)
 
 #--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.stats
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the opt-in instrumentation of the solver engine.
+
+An engine given a stats object reports the duration of every solving stage
+and counts outcomes: how captchas were segmented and why segmentation
+failed, cache hits and misses, found and unrecognised letters and solved
+captchas. Any object with `stage(name, seconds)` and `count(name, amount)`
+methods can be used, `SolverStats` aggregates them in memory and
+`StatsExporter` dumps the aggregates periodically. Engines without stats
+skip all of it.
+
+Stats are kept per process: the download stage is reported to the engine
+of the downloaded captcha, and workers of `AmazonCaptcha.solve_many` report
+to their own.
+
+Stages:
+    download, decode, monochrome, segment, extract, fingerprint, classify, solve
+
+Counters:
+    segment.six_letters, segment.wrapped_letter, segment.failed.narrow_first_letter,
+    segment.failed.letter_count, letters.found, letters.unrecognised, cache.hit, cache.miss,
+    solve.solved, solve.not_solved
+
+"""
+
+import threading
+import json
+import time
+
+#--------------------------------------------------------------------------------------------------------------
+
+class SolverStats(object):
+
+    def __init__(self):
+        """Initializes an empty, thread-safe SolverStats instance."""
+
+        self._stages = dict()
+        self._counters = dict()
+        self._lock = threading.Lock()
+
+    def stage(self, name, seconds):
+        """
+        Records the duration of a stage.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): How long it took.
+
+        """
+
+        with self._lock:
+            stage = self._stages.get(name)
+
+            if stage is None:
+                self._stages[name] = [1, seconds, seconds]
+
+            else:
+                stage[0] += 1
+                stage[1] += seconds
+                stage[2] = max(stage[2], seconds)
+
+    def count(self, name, amount=1):
+        """
+        Increments a counter.
+
+        Args:
+            name (str): Name of the counter.
+            amount (int, optional): Increment.
+
+        """
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self, reset=False):
+        """
+        Returns the aggregated stats.
+
+        Args:
+            reset (bool, optional): If set to True, starts aggregating anew.
+
+        Returns:
+            dict: Number of calls, total, mean and maximum duration in
+                seconds of every stage, and every counter.
+
+        """
+
+        with self._lock:
+            stages = {name: {'count': count, 'total': total, 'mean': total / count, 'max': maximum} for name, (count, total, maximum) in self._stages.items()}
+            counters = dict(self._counters)
+
+            if reset:
+                self._stages.clear()
+                self._counters.clear()
+
+        return {'stages': stages, 'counters': counters}
+
+    def reset(self):
+        """Drops every aggregate."""
+
+        self.snapshot(reset=True)
+
+class StatsExporter(object):
+
+    def __init__(self, stats, target, interval=60, reset=False):
+        """
+        Initializes the StatsExporter instance.
+
+        Args:
+            stats (SolverStats): Stats to be exported.
+            target (str or callable): Path to a file the snapshots are
+                appended to as JSON lines, OR a callable receiving every
+                snapshot.
+            interval (float, optional): Seconds between exports.
+            reset (bool, optional): If set to True, every snapshot only
+                covers the time since the previous one.
+
+        """
+
+        self.stats = stats
+        self.target = target
+        self.interval = interval
+        self.reset = reset
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def export(self):
+        """Exports a single snapshot right away."""
+
+        snapshot = dict(self.stats.snapshot(self.reset), timestamp=time.time())
+
+        if callable(self.target):
+            self.target(snapshot)
+
+        else:
+            with open(self.target, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(snapshot) + '\n')
+
+    def _run(self):
+        """Exports snapshots until stopped."""
+
+        while not self._stopped.wait(self.interval):
+            self.export()
+
+    def start(self):
+        """Starts exporting from a background thread."""
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread and exports the last snapshot."""
+
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.export()
+
+#--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,568 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.training
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the process-wide index of amazoncaptcha's training data.
+
+The training data is shipped twice: as human-editable `<letter>.json` files
+and as a compact binary index converted from them. The binary index holds a
+header, a sorted column of fixed-width fingerprint hashes and a column of
+letters, so it can be memory-mapped and binary-searched without parsing.
+Processes that map the same file share one copy of it through the page cache.
+
+Letters are identified by fingerprints: the number of pixels of a trimmed
+letter followed by its pixels packed into bits, ink being 1. The JSON files
+keep the original keys, zlib-compressed '1'/'0' pixel strings, which are
+re-keyed into fingerprints when the files are loaded.
+
+New training data is appended as segments: small JSON files of the same
+pseudo binaries in the `segments` subfolder, each holding only fingerprints
+that were not stored yet. Segments are read on top of the letter files and
+the binary index, and are merged into them by `compact_training_data`.
+
+Attributes:
+    TRAINING_DATA_FOLDER (str): Folder with `<letter>.json` training files.
+    BINARY_INDEX_PATH (str): Path to the binary index converted from them.
+    BINARY_INDEX_MAGIC (bytes): First bytes of every binary index file.
+    BINARY_INDEX_VERSION (int): Version of the binary index layout.
+    HASH_SIZE (int): Width of a single fingerprint hash in bytes.
+    SEGMENTS_FOLDER_NAME (str): Subfolder of a training folder with segments.
+    MAX_SEGMENTS (int): Number of segments that triggers a compaction.
+
+"""
+
+from .exceptions import TrainingDataError
+
+import threading
+import hashlib
+import struct
+import bisect
+import zlib
+import mmap
+import json
+import ast
+import os
+
+#--------------------------------------------------------------------------------------------------------------
+
+TRAINING_DATA_FOLDER = os.path.join(os.path.abspath(os.path.dirname(os.path.abspath(__file__))), 'training_data')
+
+BINARY_INDEX_PATH = os.path.join(TRAINING_DATA_FOLDER, 'index.bin')
+BINARY_INDEX_MAGIC = b'ACTI'
+BINARY_INDEX_VERSION = 2
+HASH_SIZE = 8
+
+SEGMENTS_FOLDER_NAME = 'segments'
+MAX_SEGMENTS = 16
+
+_HEADER = struct.Struct('<4sHHI')
+_INK_TABLE = bytes.maketrans(bytes(range(256)), b'1' + b'0' * 255)
+
+_training_index = None
+_training_index_lock = threading.Lock()
+
+#--------------------------------------------------------------------------------------------------------------
+
+def get_alphabet(folder=TRAINING_DATA_FOLDER):
+    """
+    Lists the letters that have training data.
+
+    Args:
+        folder (str, optional): Folder with training files.
+
+    Returns:
+        :obj:`list` of :obj:`str`: Sorted letters.
+
+    """
+
+    return sorted(filename.split('.')[0] for filename in os.listdir(folder) if filename.endswith('.json'))
+
+def _pack_bits(bits):
+    """Packs a '1'/'0' string, given as bytes, into a fingerprint."""
+
+    return len(bits).to_bytes(4, 'big') + int(bits or b'0', 2).to_bytes((len(bits) + 7) // 8, 'big')
+
+def fingerprint(data):
+    """
+    Computes the fingerprint of a monochromed letter.
+
+    Args:
+        data (bytes): Raw pixels of the letter, where 0 stands for ink,
+            e.g. `letter.tobytes()`.
+
+    Returns:
+        bytes: Pixel count followed by the bit-packed pixels.
+
+    """
+
+    return _pack_bits(bytes(data).translate(_INK_TABLE))
+
+def fingerprint_from_pseudo_binary(pseudo_binary):
+    """
+    Re-keys a pseudo binary stored in the JSON training files.
+
+    Args:
+        pseudo_binary (str): `str()` of zlib-compressed '1'/'0' pixels.
+
+    Returns:
+        bytes: The same letter's fingerprint.
+
+    """
+
+    return _pack_bits(zlib.decompress(ast.literal_eval(pseudo_binary)))
+
+def pseudo_binary(data):
+    """
+    Encodes a monochromed letter the way the JSON training files store it.
+
+    Args:
+        data (bytes): Raw pixels of the letter, where 0 stands for ink.
+
+    Returns:
+        str: `str()` of zlib-compressed '1'/'0' pixels.
+
+    """
+
+    return str(zlib.compress(bytes(data).translate(_INK_TABLE)))
+
+def list_segments(folder=TRAINING_DATA_FOLDER):
+    """
+    Lists the segments of a training folder in the order they were written.
+
+    Args:
+        folder (str, optional): Folder with training files.
+
+    Returns:
+        :obj:`list` of :obj:`str`: Paths to the segments.
+
+    """
+
+    segments_folder = os.path.join(folder, SEGMENTS_FOLDER_NAME)
+
+    if not os.path.isdir(segments_folder):
+        return list()
+
+    return [os.path.join(segments_folder, filename) for filename in sorted(os.listdir(segments_folder)) if filename.endswith('.json')]
+
+def read_segment(path):
+    """
+    Reads a segment.
+
+    Args:
+        path (str): Path to the segment.
+
+    Returns:
+        dict: Letters as keys and lists of pseudo binaries as values.
+
+    """
+
+    with open(path, 'r', encoding='utf-8') as js:
+        return json.loads(js.read())
+
+def write_segment(entries, folder=TRAINING_DATA_FOLDER):
+    """
+    Appends a segment to a training folder.
+
+    Args:
+        entries (dict): Letters as keys and lists of pseudo binaries as values.
+        folder (str, optional): Folder with training files.
+
+    Returns:
+        str: Path to the written segment.
+
+    """
+
+    segments_folder = os.path.join(folder, SEGMENTS_FOLDER_NAME)
+    os.makedirs(segments_folder, exist_ok=True)
+
+    segments = list_segments(folder)
+    number = int(os.path.basename(segments[-1]).split('.')[0]) + 1 if segments else 1
+    path = os.path.join(segments_folder, f'{number:06d}.json')
+    temporary_path = path + '.tmp'
+
+    with open(temporary_path, 'w', encoding='utf-8') as js:
+        js.write(json.dumps(entries))
+
+    os.replace(temporary_path, path)
+
+    return path
+
+def load_segments(folder=TRAINING_DATA_FOLDER):
+    """
+    Reads every segment into a single fingerprint -> letter mapping.
+
+    Args:
+        folder (str, optional): Folder with training files.
+
+    Returns:
+        dict: Fingerprints as keys and letters as values.
+
+    """
+
+    index = dict()
+    for path in list_segments(folder):
+        for letter, pseudo_binaries in sorted(read_segment(path).items()):
+            for letter_pseudo_binary in pseudo_binaries:
+                index.setdefault(fingerprint_from_pseudo_binary(letter_pseudo_binary), letter)
+
+    return index
+
+def load_training_data(folder=TRAINING_DATA_FOLDER):
+    """
+    Reads every training file into a single fingerprint -> letter mapping.
+
+    If the same fingerprint is stored for several letters, the one that
+    comes first alphabetically wins. Segments are read after the letter
+    files.
+
+    Args:
+        folder (str, optional): Folder with training files.
+
+    Returns:
+        dict: Fingerprints as keys and letters as values.
+
+    """
+
+    index = dict()
+    for letter in get_alphabet(folder):
+        with open(os.path.join(folder, letter + '.json'), 'r', encoding='utf-8') as js:
+            for pseudo_binary in json.loads(js.read()):
+                index.setdefault(fingerprint_from_pseudo_binary(pseudo_binary), letter)
+
+    for key, letter in load_segments(folder).items():
+        index.setdefault(key, letter)
+
+    return index
+
+def hash_key(key):
+    """
+    Hashes a fingerprint into a fixed-width binary index entry.
+
+    Args:
+        key (bytes): Fingerprint to be hashed.
+
+    Returns:
+        bytes: `HASH_SIZE` bytes long digest.
+
+    """
+
+    return hashlib.blake2b(key, digest_size=HASH_SIZE).digest()
+
+def write_binary_index(index, path=BINARY_INDEX_PATH):
+    """
+    Writes a fingerprint -> letter mapping as a binary index file.
+
+    Args:
+        index (dict): Fingerprints and letters, as returned by `load_training_data`.
+        path (str, optional): Where the binary index should be written.
+
+    Returns:
+        int: Number of stored entries.
+
+    Raises:
+        TrainingDataError: If two fingerprints share a hash or a letter is not
+            a single ASCII character.
+
+    """
+
+    entries = dict()
+    for key, letter in index.items():
+        if len(letter.encode('ascii')) != 1:
+            raise TrainingDataError(path, f'cannot store "{letter}" as a single byte letter.')
+
+        digest = hash_key(key)
+        if entries.setdefault(digest, letter) != letter:
+            raise TrainingDataError(path, 'contains a hash collision between different letters.')
+
+    digests = sorted(entries)
+    temporary_path = path + '.tmp'
+
+    with open(temporary_path, 'wb') as f:
+        f.write(_HEADER.pack(BINARY_INDEX_MAGIC, BINARY_INDEX_VERSION, HASH_SIZE, len(digests)))
+        f.write(b''.join(digests))
+        f.write(''.join(entries[digest] for digest in digests).encode('ascii'))
+
+    os.replace(temporary_path, path)
+
+    return len(digests)
+
+def convert_training_data(folder=TRAINING_DATA_FOLDER, path=BINARY_INDEX_PATH):
+    """
+    Converts `<letter>.json` training files into a binary index.
+
+    Must be rerun every time the JSON files are changed, otherwise the
+    solver will keep using the outdated binary index.
+
+    Args:
+        folder (str, optional): Folder with training files.
+        path (str, optional): Where the binary index should be written.
+
+    Returns:
+        int: Number of stored entries.
+
+    """
+
+    return write_binary_index(load_training_data(folder), path)
+
+def compact_training_data(folder=TRAINING_DATA_FOLDER, path=None):
+    """
+    Merges the segments of a training folder into its `<letter>.json` files.
+
+    Only the letter files that got new entries are rewritten, the binary
+    index is converted again if the folder has one, and the merged segments
+    are removed. Pseudo binaries already stored in a letter file are not
+    added twice, so an interrupted compaction can simply be rerun.
+
+    Args:
+        folder (str, optional): Folder with training files.
+        path (str, optional): Binary index to be converted again. Defaults
+            to `index.bin` inside the folder.
+
+    Returns:
+        int: Number of entries added to the letter files.
+
+    """
+
+    segments = list_segments(folder)
+    path = path or os.path.join(folder, os.path.basename(BINARY_INDEX_PATH))
+
+    merged = dict()
+    for segment in segments:
+        for letter, pseudo_binaries in read_segment(segment).items():
+            merged.setdefault(letter, list()).extend(pseudo_binaries)
+
+    added = 0
+    for letter, pseudo_binaries in sorted(merged.items()):
+        letter_path = os.path.join(folder, letter + '.json')
+        stored = list()
+
+        if os.path.isfile(letter_path):
+            with open(letter_path, 'r', encoding='utf-8') as js:
+                stored = json.loads(js.read())
+
+        known = set(stored)
+        new = [letter_pseudo_binary for letter_pseudo_binary in dict.fromkeys(pseudo_binaries) if letter_pseudo_binary not in known]
+
+        if new:
+            with open(letter_path + '.tmp', 'w', encoding='utf-8') as js:
+                js.write(json.dumps(stored + new))
+
+            os.replace(letter_path + '.tmp', letter_path)
+            added += len(new)
+
+    if segments and os.path.isfile(path):
+        write_binary_index(load_training_data(folder), path)
+
+    for segment in segments:
+        os.remove(segment)
+
+    return added
+
+class _HashColumn(object):
+    """Sorted column of fixed-width hashes, viewed as a sequence for bisect."""
+
+    def __init__(self, buffer, offset, count, size):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.size = size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        start = self.offset + position * self.size
+        return self.buffer[start:start + self.size]
+
+class BinaryTrainingIndex(object):
+
+    def __init__(self, path=BINARY_INDEX_PATH):
+        """
+        Memory-maps a binary index file.
+
+        Nothing is parsed or copied: lookups binary-search the mapped hash
+        column and read a single byte from the letter column.
+
+        Args:
+            path (str, optional): Path to the binary index.
+
+        Raises:
+            TrainingDataError: If the file is not a supported binary index.
+
+        """
+
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._buffer) < _HEADER.size:
+            raise TrainingDataError(path, 'is too short to be a binary index.')
+
+        magic, version, size, count = _HEADER.unpack_from(self._buffer)
+        if magic != BINARY_INDEX_MAGIC or version != BINARY_INDEX_VERSION or size != HASH_SIZE:
+            raise TrainingDataError(path, 'is not a supported binary index.')
+
+        if len(self._buffer) != _HEADER.size + count * (size + 1):
+            raise TrainingDataError(path, 'is truncated or corrupted.')
+
+        self._hashes = _HashColumn(self._buffer, _HEADER.size, count, size)
+        self._letters_offset = _HEADER.size + count * size
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        """
+        Looks up the letter stored for a fingerprint.
+
+        Args:
+            key (bytes): Fingerprint to be looked up.
+            default (optional): Returned if there is no such key.
+
+        Returns:
+            str: The letter OR `default`.
+
+        """
+
+        digest = hash_key(key)
+        position = bisect.bisect_left(self._hashes, digest)
+
+        if position < len(self._hashes) and self._hashes[position] == digest:
+            return chr(self._buffer[self._letters_offset + position])
+
+        return default
+
+    def close(self):
+        """Unmaps the binary index file."""
+
+        self._buffer.close()
+
+    def letters(self):
+        """
+        Lists the distinct letters stored in the index.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Sorted letters.
+
+        """
+
+        return sorted(set(self._buffer[self._letters_offset:].decode('ascii')))
+
+class SegmentedTrainingIndex(object):
+
+    def __init__(self, index, segments):
+        """
+        Reads the segments of a training folder on top of a binary index.
+
+        Only the segment entries that the binary index does not know are
+        kept, so opening it costs time in proportion to the segments.
+
+        Args:
+            index (BinaryTrainingIndex): Index of the letter files.
+            segments (dict): Fingerprints and letters, as returned by
+                `load_segments`.
+
+        """
+
+        self.index = index
+        self.segments = {key: letter for key, letter in segments.items() if index.get(key) is None}
+
+    def __len__(self):
+        return len(self.index) + len(self.segments)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        """
+        Looks up the letter stored for a fingerprint.
+
+        Args:
+            key (bytes): Fingerprint to be looked up.
+            default (optional): Returned if there is no such key.
+
+        Returns:
+            str: The letter OR `default`.
+
+        """
+
+        letter = self.index.get(key)
+
+        if letter is None:
+            return self.segments.get(key, default)
+
+        return letter
+
+    def close(self):
+        """Unmaps the binary index file."""
+
+        self.index.close()
+
+    def letters(self):
+        """
+        Lists the distinct letters stored in the index.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Sorted letters.
+
+        """
+
+        return sorted(set(self.index.letters()) | set(self.segments.values()))
+
+def open_training_index(folder=TRAINING_DATA_FOLDER):
+    """
+    Opens the training data of a folder for lookups.
+
+    The memory-mapped binary index is used when it is present, with the
+    segments read on top of it, otherwise the JSON training files and the
+    segments are parsed into a dict.
+
+    Args:
+        folder (str, optional): Folder with training files.
+
+    Returns:
+        BinaryTrainingIndex, SegmentedTrainingIndex or dict: Object with
+            `get(key)` returning the letter stored for a fingerprint or None.
+
+    """
+
+    path = os.path.join(folder, os.path.basename(BINARY_INDEX_PATH))
+
+    if not os.path.isfile(path):
+        return load_training_data(folder)
+
+    index = BinaryTrainingIndex(path)
+
+    if list_segments(folder):
+        return SegmentedTrainingIndex(index, load_segments(folder))
+
+    return index
+
+def get_training_index():
+    """
+    Returns the process-wide training index, building it on the first call.
+
+    See `open_training_index`.
+
+    Returns:
+        BinaryTrainingIndex, SegmentedTrainingIndex or dict: Object with
+            `get(key)` returning the letter stored for a fingerprint or None.
+
+    """
+
+    global _training_index
+
+    if _training_index is None:
+        with _training_index_lock:
+            if _training_index is None:
+                _training_index = open_training_index(TRAINING_DATA_FOLDER)
+
+    return _training_index
+
+#--------------------------------------------------------------------------------------------------------------
@@ -8,6 +8,8 @@ This module contains the set of amazoncaptcha's utilities.
 """
 
 from PIL import Image, ImageChops
+from itertools import chain
+import struct
 
 #--------------------------------------------------------------------------------------------------------------
 
@@ -51,39 +53,163 @@ def merge_horizontally(img1, img2):
 
     return merged
 
-def find_letter_boxes(img, maxlength):
+def column_projection(data, width):
+    """
+    Counts black pixels in every column of a monochromed image.
+
+    Reads the image as a single bytes buffer instead of pixel by pixel.
+
+    Args:
+        data (bytes): Raw pixels of a monochromed image, e.g. `img.tobytes()`.
+        width (int): Width of the image.
+
+    Returns:
+        :obj:`list` of :obj:`int`: Number of black pixels per column.
+
+    """
+
+    return [data[x::width].count(0) for x in range(width)]
+
+def find_letter_boxes(img, maxlength, projection=None):
     """
     Finds and separates letters from a captcha image.
 
+    Letter edges and the split points of overlapping letters are derived
+    from the column projection in a single pass.
+
     Args:
-        img (PIL.Image): Monochromed captcha.
+        img (PIL.Image): Monochromed captcha. May be None if the projection
+            is given.
         maxlength (int): Maximum letter length by X axis.
+        projection (:obj:`list` of :obj:`int`, optional): Column projection
+            of the captcha, if it was already computed.
 
     Returns:
         letter_boxes (:obj:`list` of :obj:`tuple`): List with X coords of each letter.
 
     """
 
-    image_columns = [[img.getpixel((x, y)) for y in range(img.height)] for x in range(img.width)]
-    image_code = [1 if 0 in column else 0 for column in image_columns]
-    xpoints = [d for d, s in zip(range(len(image_code)), image_code) if s]
-    xcoords = [x for x in xpoints if x - 1 not in xpoints or x + 1 not in xpoints]
+    if projection is None:
+        projection = column_projection(img.tobytes(), img.width)
+
+    width = len(projection)
+    last_column = width - 1
+    xcoords = [x for x, ink in enumerate(projection) if ink and not (0 < x < last_column and projection[x - 1] and projection[x + 1])]
 
     if len(xcoords) % 2:
         xcoords.insert(1, xcoords[0])
 
     letter_boxes = list()
     for s, e in zip(xcoords[0::2], xcoords[1::2]):
-        start, end = s, min(e + 1, img.width - 1)
+        start, end = s, min(e + 1, width - 1)
 
         if end - start <= maxlength:
             letter_boxes.append((start, end))
 
         else:
-            two_letters = {k: v.count(0) for k, v in enumerate(image_columns[start + 5:end - 5])}
-            divider = min(two_letters, key=two_letters.get) + 5
+            two_letters = projection[start + 5:end - 5]
+            divider = two_letters.index(min(two_letters)) + 5
             letter_boxes.extend([(start, start + divider), (start + divider + 1, end)])
 
     return letter_boxes
 
+def extract_letter(data, width, height, letter_boxes, projection):
+    """
+    Finds a letter's region without white spaces/borders and copies it out.
+
+    Works the same way as `cut_the_white`, applied to the letter boxes
+    cropped and merged horizontally, but on the projections of the single
+    captcha buffer, so no image is created.
+
+    Args:
+        data (bytes): Raw pixels of the monochromed captcha.
+        width (int): Width of the captcha.
+        height (int): Height of the captcha.
+        letter_boxes (:obj:`list` of :obj:`tuple`): X coords of the letter
+            parts, laid side by side. There are two of them if the letter
+            ends at the beginning of the image.
+        projection (:obj:`list` of :obj:`int`): Column projection of the captcha.
+
+    Returns:
+        tuple: Letter region, being X coords of the letter parts, top and
+            bottom Y coords, and raw pixels of the letter.
+
+    """
+
+    columns = [x for start, end in letter_boxes for x in range(start, end)]
+    inked = [i for i, x in enumerate(columns) if projection[x]]
+
+    if not inked:
+        region = (list(letter_boxes), 0, height)
+        return region, letter_pixels(data, width, region)
+
+    segments = list()
+    for x in columns[inked[0]:inked[-1] + 1]:
+        if segments and segments[-1][1] == x:
+            segments[-1] = (segments[-1][0], x + 1)
+
+        else:
+            segments.append((x, x + 1))
+
+    letter_width = sum(end - start for start, end in segments)
+    letter = letter_pixels(data, width, (segments, 0, height))
+    top, bottom = letter.find(0) // letter_width, letter.rfind(0) // letter_width + 1
+
+    return (segments, top, bottom), letter[top * letter_width:bottom * letter_width]
+
+def letter_pixels(data, width, region):
+    """
+    Copies raw pixels of a letter region out of the captcha buffer.
+
+    All the rows are gathered by a single `struct.unpack_from` call, so
+    there is no Python-level loop over the rows.
+
+    Args:
+        data (bytes): Raw pixels of the monochromed captcha.
+        width (int): Width of the captcha.
+        region (tuple): Letter region as returned by `extract_letter`.
+
+    Returns:
+        bytes: Raw pixels of the letter, row by row.
+
+    """
+
+    segments, top, bottom = region
+
+    if bottom <= top or not segments:
+        return b''
+
+    order = sorted(range(len(segments)), key=lambda i: segments[i][0])
+    ascending = [segments[i] for i in order]
+
+    row_format = ''
+    for (start, end), following in zip(ascending, ascending[1:] + [(ascending[0][0] + width, None)]):
+        row_format += f'{end - start}s{following[0] - end}x'
+
+    row_format = row_format * (bottom - top)
+    parts = struct.unpack_from(row_format[:row_format.rindex('s') + 1], data, top * width + ascending[0][0])
+
+    if order != sorted(order):
+        parts = chain.from_iterable(zip(*(parts[order.index(i)::len(order)] for i in range(len(order)))))
+
+    return b''.join(parts)
+
+def extract_captcha_id(captcha_link):
+    """
+    Extracts a captcha id from a captcha link.
+
+    Args:
+        captcha_link (str): A link to the captcha image, e.g.
+            `.../captcha/usvmgloq/Captcha_kwrrnqwkph.jpg`.
+
+    Returns:
+        str: Captcha ID OR None if the link does not contain one.
+
+    """
+
+    if '/captcha/' not in captcha_link or '/Captcha_' not in captcha_link:
+        return None
+
+    return ''.join(captcha_link.split('/captcha/')[1].replace('.jpg', '').split('/Captcha_'))
+
 #--------------------------------------------------------------------------------------------------------------
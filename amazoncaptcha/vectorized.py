@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+amazoncaptcha.vectorized
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains VectorizedEngine, a solver engine classifying letters
+of many captchas at once with NumPy.
+
+Every training letter is normalized to a fixed grid: its pixel count
+followed by its bit-packed pixels, left-aligned and zero-padded to the size
+of the largest letter. The rows are stacked into a sorted template matrix,
+so a whole batch of letters is matched exactly by a single `searchsorted`.
+Optionally, letters without an exact match are matched to the closest
+template of the same pixel count by XOR and popcount over the matrix, all the
+misses of a pixel count at once.
+
+NumPy is an optional dependency, installed with
+`pip install amazoncaptcha[numpy]`.
+
+"""
+
+from .training import TRAINING_DATA_FOLDER, load_training_data
+from .engine import SolverEngine
+
+#--------------------------------------------------------------------------------------------------------------
+
+_NEAR_MATCH_CHUNK_BYTES = 1 << 24
+
+#--------------------------------------------------------------------------------------------------------------
+
+def _import_numpy():
+    """Imports NumPy, explaining how to install it if it is missing."""
+
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('NumPy is required for the vectorized engine, install it with "pip install amazoncaptcha[numpy]".')
+
+    return numpy
+
+#--------------------------------------------------------------------------------------------------------------
+
+class TemplateMatrix(object):
+
+    def __init__(self, training_data=None, max_distance=0):
+        """
+        Initializes the TemplateMatrix instance.
+
+        Args:
+            training_data (dict, optional): Fingerprints and letters, as
+                returned by `training.load_training_data`. Defaults to the
+                shipped training data.
+            max_distance (int, optional): Number of differing pixels a letter
+                without an exact match may have to its closest template.
+                Zero disables near matching.
+
+        """
+
+        self.np = _import_numpy()
+        self.max_distance = max_distance
+
+        if training_data is None:
+            training_data = load_training_data(TRAINING_DATA_FOLDER)
+
+        self.grid_bits = max(int.from_bytes(key[:4], 'big') for key in training_data) if training_data else 0
+        self.grid_bits += -self.grid_bits % 8
+        self.row_size = 4 + self.grid_bits // 8
+
+        keys = list(training_data)
+        rows = self._rows(self._normalize(key) for key in keys)
+        order = self.np.argsort(rows, kind='stable')
+
+        self.rows = rows[order]
+        self.letters = self.np.array([training_data[key] for key in keys], dtype='U1')[order]
+        self._letter_codes = self.letters.view(self.np.uint32).astype(self.np.int64)
+
+        matrix = self.rows.view(self.np.uint8).reshape(len(keys), self.row_size)
+        self.counts = matrix[:, :4].copy().view('>u4').ravel()
+        self.pixels = matrix[:, 4:]
+        self._pixel_words = self._words(self.pixels)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _normalize(self, key):
+        """Lays a fingerprint out on the fixed grid, None if it does not fit."""
+
+        count = int.from_bytes(key[:4], 'big')
+        if count > self.grid_bits or len(key) != 4 + (count + 7) // 8:
+            return None
+
+        return key[:4] + (int.from_bytes(key[4:], 'big') << (self.grid_bits - count)).to_bytes(self.row_size - 4, 'big')
+
+    def _rows(self, rows):
+        """Stacks rows laid out on the grid into a single array."""
+
+        return self.np.frombuffer(b''.join(rows), dtype=f'V{self.row_size}')
+
+    def _words(self, pixels):
+        """Pads rows of grid pixels to whole 64-bit words, so they are XORed and counted a word at a time."""
+
+        words = self.np.zeros((len(pixels), -(-pixels.shape[1] // 8) * 8), dtype=self.np.uint8)
+        words[:, :pixels.shape[1]] = pixels
+
+        return words.view(self.np.uint64)
+
+    def _popcount(self, array):
+        """Counts set bits of a uint64 array along its last axis."""
+
+        if hasattr(self.np, 'bitwise_count'):
+            return self.np.bitwise_count(array).sum(axis=-1, dtype=self.np.int64)
+
+        return self.np.unpackbits(array.view(self.np.uint8), axis=-1).sum(axis=-1, dtype=self.np.int64)
+
+    def _nearest_many(self, grid):
+        """
+        Finds the closest templates of letters laid out on the grid.
+
+        Letters are grouped by their pixel count, and the distances of every
+        group to the templates of that count are computed by one XOR and
+        popcount over a broadcast array, in chunks of bounded size.
+        """
+
+        matches = [None] * len(grid)
+        counts = grid[:, :4].copy().view('>u4').ravel()
+
+        for count in self.np.unique(counts).tolist():
+            start, end = self.np.searchsorted(self.counts, [count, count + 1])
+            if start == end:
+                continue
+
+            templates = self._pixel_words[start:end]
+            members = self.np.flatnonzero(counts == count)
+            chunk = max(1, _NEAR_MATCH_CHUNK_BYTES // templates.nbytes)
+
+            for chunk_start in range(0, len(members), chunk):
+                chunk_members = members[chunk_start:chunk_start + chunk]
+                distances = self._popcount(self._words(grid[chunk_members, 4:])[:, None, :] ^ templates[None, :, :])
+
+                best = self.np.argmin(distances * 0x110000 + self._letter_codes[start:end], axis=1)
+                best_distances = distances[self.np.arange(len(chunk_members)), best]
+
+                for member, index, distance in zip(chunk_members.tolist(), best.tolist(), best_distances.tolist()):
+                    if distance <= self.max_distance:
+                        matches[member] = (str(self.letters[start + index]), distance)
+
+        return matches
+
+    def nearest(self, row):
+        """
+        Finds the closest template of the same pixel count.
+
+        Ties are broken in favour of the letter that comes first alphabetically.
+
+        Args:
+            row (numpy.ndarray): A letter laid out on the grid, as uint8.
+
+        Returns:
+            tuple: The letter and its distance OR None if nothing is within
+                `max_distance`.
+
+        """
+
+        return self._nearest_many(row.reshape(1, -1))[0]
+
+    def classify_many(self, fingerprints):
+        """
+        Classifies any number of letters in one vectorized lookup.
+
+        Args:
+            fingerprints (:obj:`list` of :obj:`bytes`): Letter fingerprints.
+
+        Returns:
+            :obj:`list`: Letters, None for unrecognised ones.
+
+        """
+
+        letters = [None] * len(fingerprints)
+        rows = [self._normalize(key) for key in fingerprints]
+        fitting = [position for position, row in enumerate(rows) if row is not None]
+
+        if not fitting or not len(self.rows):
+            return letters
+
+        queries = self._rows(rows[position] for position in fitting)
+        found = self.np.minimum(self.np.searchsorted(self.rows, queries), len(self.rows) - 1)
+        matched = self.rows[found] == queries
+
+        for position, index, is_matched in zip(fitting, found.tolist(), matched.tolist()):
+            if is_matched:
+                letters[position] = str(self.letters[index])
+
+        if self.max_distance:
+            misses = self.np.flatnonzero(~matched)
+            grid = queries.view(self.np.uint8).reshape(len(queries), self.row_size)
+
+            for number, match in zip(misses.tolist(), self._nearest_many(grid[misses])):
+                if match is not None:
+                    letters[fitting[number]] = match[0]
+
+        return letters
+
+    def get(self, key, default=None):
+        """
+        Looks up the letter stored for a single fingerprint.
+
+        Args:
+            key (bytes): Fingerprint to be looked up.
+            default (optional): Returned if there is no such key.
+
+        Returns:
+            str: The letter OR `default`.
+
+        """
+
+        letter = self.classify_many([key])[0]
+
+        return letter if letter is not None else default
+
+class VectorizedEngine(SolverEngine):
+
+    def __init__(self, templates=None, cache=None, max_distance=0, stats=None):
+        """
+        Initializes the VectorizedEngine instance.
+
+        Args:
+            templates (TemplateMatrix, optional): Template matrix to classify
+                against. Defaults to one built from the shipped training data.
+            cache (cache.SolutionCache, optional): Opt-in cache of solutions.
+            max_distance (int, optional): Passed to the default template
+                matrix, ignored if `templates` is given.
+            stats (stats.SolverStats, optional): Opt-in receiver of stage
+                durations and outcome counters.
+
+        """
+
+        templates = templates if templates is not None else TemplateMatrix(max_distance=max_distance)
+
+        super().__init__(training_index=templates, cache=cache, stats=stats)
+
+        self.templates = templates
+
+    def classify_fingerprints(self, fingerprints):
+        return self.templates.classify_many(fingerprints)
+
+#--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.benchmark
+~~~~~~~~~~~~~~~~~~~~
+
+Offline micro-benchmarks of the solver and each of its stages.
+
+Runs against `tests/captchas` and a synthetic corpus generated from them by
+shifting every image horizontally with wrap-around, which is what Amazon's
+captchas look like when a letter ends at the beginning of the image. The
+corpus is generated from a fixed seed, so every run measures the same images.
+
+Measured are the per-stage latency percentiles of a warm solver, the cold
+start of a fresh interpreter up to the first solution, and the throughput
+in captchas per second. Results are written as JSON and two result files can
+be compared to catch regressions.
+
+Usage:
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --compare baseline.json results.json
+
+Attributes:
+    HERE (str): Folder of this script.
+    CAPTCHAS_FOLDER (str): Folder with the captchas shipped for tests.
+    STAGES (list of str): Names of the measured solver stages, in order.
+    TOLERANCE (float): Default relative slowdown reported as a regression.
+
+"""
+
+from io import BytesIO
+import subprocess
+import statistics
+import platform
+import argparse
+import random
+import json
+import time
+import sys
+import os
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from amazoncaptcha.engine import load_image, monochrome, segment_letters, cut_letters, classify, format_solution, get_default_engine
+from amazoncaptcha.training import fingerprint
+from amazoncaptcha.utils import column_projection
+from amazoncaptcha.__version__ import __version__
+from amazoncaptcha import AmazonCaptcha
+
+from PIL import Image, ImageChops
+
+#--------------------------------------------------------------------------------------------------------------
+
+CAPTCHAS_FOLDER = os.path.join(os.path.dirname(HERE), 'tests', 'captchas')
+STAGES = ['decode', 'monochrome', 'find_letter_boxes', 'extract_letters', 'save_letters', 'translate']
+TOLERANCE = 0.1
+
+_COLD_START = '''
+import time
+started = time.perf_counter()
+from amazoncaptcha import AmazonCaptcha
+imported = time.perf_counter()
+AmazonCaptcha({path!r}).solve()
+solved = time.perf_counter()
+print(imported - started, solved - imported)
+'''
+
+#--------------------------------------------------------------------------------------------------------------
+
+def load_corpus(synthetic=200, seed=0, folder=CAPTCHAS_FOLDER):
+    """
+    Reads the test captchas and generates the synthetic ones.
+
+    Args:
+        synthetic (int, optional): Number of synthetic captchas.
+        seed (int, optional): Seed of the synthetic corpus.
+        folder (str, optional): Folder with source captchas.
+
+    Returns:
+        :obj:`list` of :obj:`tuple`: Names and raw bytes of the captchas.
+
+    """
+
+    corpus = list()
+    for filename in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, filename), 'rb') as f:
+            corpus.append((filename, f.read()))
+
+    randomizer = random.Random(seed)
+    sources = list(corpus)
+
+    for number in range(synthetic):
+        filename, data = randomizer.choice(sources)
+        img = Image.open(BytesIO(data))
+        shift = randomizer.randrange(img.width)
+
+        output = BytesIO()
+        ImageChops.offset(img, shift, 0).save(output, format=img.format)
+        corpus.append((f'synthetic_{number}_{shift}_{filename}', output.getvalue()))
+
+    return corpus
+
+def percentiles(samples):
+    """
+    Summarizes latency samples.
+
+    Args:
+        samples (:obj:`list` of :obj:`float`): Latencies in seconds.
+
+    Returns:
+        dict: Mean and 50th, 90th and 99th percentiles in microseconds,
+            and the number of samples.
+
+    """
+
+    ordered = sorted(samples)
+    summary = {'count': len(ordered), 'mean': statistics.mean(ordered) * 1e6}
+
+    for percentile in (50, 90, 99):
+        summary[f'p{percentile}'] = ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))] * 1e6
+
+    return {key: round(value, 2) for key, value in summary.items()}
+
+def measure_stages(corpus, rounds=5):
+    """
+    Times every solver stage on every captcha of the corpus.
+
+    Args:
+        corpus (list): Names and raw bytes of the captchas.
+        rounds (int, optional): Number of passes over the corpus.
+
+    Returns:
+        dict: Latency percentiles of every stage and of the whole solution.
+
+    """
+
+    training_index = get_default_engine().training_index
+    samples = {stage: list() for stage in STAGES + ['solve']}
+    clock = time.perf_counter
+
+    for round_number in range(rounds):
+        for name, data in corpus:
+            started = clock()
+            img = load_image(data)
+            img.load()
+            decoded = clock()
+            img = monochrome(img)
+            monochromed = clock()
+            pixels = img.tobytes()
+            projection = column_projection(pixels, img.width)
+            letter_boxes = segment_letters(pixels, img.width, projection)
+            segmented = clock()
+            letters = cut_letters(pixels, img.width, img.height, letter_boxes, projection)
+            extracted = clock()
+            fingerprints = [fingerprint(letter) for letter in letters]
+            fingerprinted = clock()
+            format_solution(classify(fingerprints, training_index))
+            translated = clock()
+
+            timestamps = [started, decoded, monochromed, segmented, extracted, fingerprinted, translated]
+            for stage, start, end in zip(STAGES, timestamps, timestamps[1:]):
+                samples[stage].append(end - start)
+
+            started = clock()
+            AmazonCaptcha(BytesIO(data)).solve()
+            samples['solve'].append(clock() - started)
+
+    return {stage: percentiles(stage_samples) for stage, stage_samples in samples.items()}
+
+def measure_throughput(corpus, rounds=5):
+    """
+    Solves the corpus over and over with a warm solver.
+
+    Args:
+        corpus (list): Names and raw bytes of the captchas.
+        rounds (int, optional): Number of passes over the corpus.
+
+    Returns:
+        dict: Number of solved captchas and captchas per second.
+
+    """
+
+    started = time.perf_counter()
+    for round_number in range(rounds):
+        for name, data in corpus:
+            AmazonCaptcha(BytesIO(data)).solve()
+
+    elapsed = time.perf_counter() - started
+
+    return {'captchas': len(corpus) * rounds, 'captchas_per_second': round(len(corpus) * rounds / elapsed, 2)}
+
+def measure_cold_start(runs=5, path=None):
+    """
+    Times fresh interpreters importing amazoncaptcha and solving one captcha.
+
+    Args:
+        runs (int, optional): Number of interpreters to start.
+        path (str, optional): Captcha to be solved.
+
+    Returns:
+        dict: Latency percentiles of the import and of the first solution,
+            the latter including the training index load.
+
+    """
+
+    path = path or os.path.join(CAPTCHAS_FOLDER, 'notcorrupted.jpg')
+    samples = {'import': list(), 'first_solve': list()}
+
+    for run in range(runs):
+        output = subprocess.run([sys.executable, '-c', _COLD_START.format(path=path)], cwd=os.path.dirname(HERE), capture_output=True, text=True, check=True).stdout
+        imported, solved = map(float, output.split())
+
+        samples['import'].append(imported)
+        samples['first_solve'].append(solved)
+
+    return {stage: percentiles(stage_samples) for stage, stage_samples in samples.items()}
+
+def run(synthetic=200, seed=0, rounds=5, cold_runs=5):
+    """
+    Runs the whole suite.
+
+    Args:
+        synthetic (int, optional): Number of synthetic captchas.
+        seed (int, optional): Seed of the synthetic corpus.
+        rounds (int, optional): Number of passes over the corpus.
+        cold_runs (int, optional): Number of cold starts.
+
+    Returns:
+        dict: Environment, corpus and results, ready to be dumped as JSON.
+
+    """
+
+    corpus = load_corpus(synthetic, seed)
+
+    # The first pass loads the training index and warms the caches
+    measure_stages(corpus, rounds=1)
+
+    return {
+        'amazoncaptcha': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'captchas': len(corpus), 'synthetic': synthetic, 'seed': seed, 'rounds': rounds},
+        'warm': measure_stages(corpus, rounds),
+        'cold': measure_cold_start(cold_runs),
+        'throughput': measure_throughput(corpus, rounds),
+    }
+
+def compare(baseline, current, tolerance=TOLERANCE, percentile='p50'):
+    """
+    Compares two result files.
+
+    Args:
+        baseline (dict): Results of the reference version.
+        current (dict): Results of the version under test.
+        tolerance (float, optional): Relative slowdown reported as a regression.
+        percentile (str, optional): Latency percentile to be compared.
+
+    Returns:
+        :obj:`list` of :obj:`tuple`: Metric, baseline value, current value,
+            relative change and whether it is a regression.
+
+    """
+
+    rows = list()
+
+    for group in ('warm', 'cold'):
+        for stage in baseline.get(group, dict()):
+            if stage in current.get(group, dict()):
+                old, new = baseline[group][stage][percentile], current[group][stage][percentile]
+                change = (new - old) / old if old else 0.0
+                rows.append((f'{group}.{stage}.{percentile}', old, new, change, change > tolerance))
+
+    if 'throughput' in baseline and 'throughput' in current:
+        old, new = baseline['throughput']['captchas_per_second'], current['throughput']['captchas_per_second']
+        change = (new - old) / old if old else 0.0
+        rows.append(('throughput.captchas_per_second', old, new, change, -change > tolerance))
+
+    return rows
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Offline micro-benchmarks of amazoncaptcha.')
+    parser.add_argument('--output', help='where to write the JSON results, printed if not set')
+    parser.add_argument('--synthetic', type=int, default=200, help='number of synthetic captchas')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic corpus')
+    parser.add_argument('--rounds', type=int, default=5, help='passes over the corpus')
+    parser.add_argument('--cold-runs', type=int, default=5, help='number of cold starts')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two result files')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='relative slowdown reported as a regression')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.compare:
+        with open(arguments.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        with open(arguments.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+
+        rows = compare(baseline, current, arguments.tolerance)
+        for metric, old, new, change, regression in rows:
+            print(f'{metric:<40} {old:>12.2f} {new:>12.2f} {change:>+8.1%}' + ('  REGRESSION' if regression else ''))
+
+        return 1 if any(row[-1] for row in rows) else 0
+
+    results = run(arguments.synthetic, arguments.seed, arguments.rounds, arguments.cold_runs)
+    dumped = json.dumps(results, indent=4)
+
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as f:
+            f.write(dumped + '\n')
+
+    else:
+        print(dumped)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+#--------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks.memory
+~~~~~~~~~~~~~~~~~
+
+Memory budget suite of the solver.
+
+Every measurement runs in a fresh interpreter, so nothing loaded by an
+earlier one is counted twice. Measured are the footprint of the training
+index, both the memory-mapped binary one and the JSON files parsed into a
+dict, the allocations of a single warm `solve()` call and the peak resident
+memory of a `solve_many` batch run with several workers.
+
+Python allocations are traced with `tracemalloc`, resident memory is taken
+from `resource.getrusage`, which is not available on Windows. Results are
+checked against `memory_budget.json` and the script exits with 1 if any of
+them is over budget, or with 2 if any of them has no budget, e.g. a batch run
+with a number of workers that was never recorded. The budget was recorded
+with CPython 3.11 on Linux; record it again with `--record` when memory use
+changes on purpose. Recording keeps the budgets of other worker counts.
+
+Other interpreters allocate differently, so `--tolerance` lets measurements
+exceed their budget by a fraction of it. CI runs the script on Python 3.10
+with a tolerance of 0.25, see `.circleci/config.yml`.
+
+Usage:
+    python benchmarks/memory.py
+    python benchmarks/memory.py --workers 4 --output memory.json
+    python benchmarks/memory.py --tolerance 0.25
+    python benchmarks/memory.py --record
+    python benchmarks/memory.py --record --workers 4
+
+Attributes:
+    HERE (str): Folder of this script.
+    BUDGET_PATH (str): Recorded budget file.
+    HEADROOM (float): Relative margin added on top of measurements by `--record`.
+    SLACK (int): Minimum absolute margin, in KB or bytes, so that tiny
+        measurements do not fail on noise.
+    TOLERANCE (float): Default fraction of the budget a measurement may
+        exceed it by when checked.
+
+"""
+
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+#--------------------------------------------------------------------------------------------------------------
+
+BUDGET_PATH = os.path.join(HERE, 'memory_budget.json')
+HEADROOM = 1.25
+SLACK = 256
+TOLERANCE = 0.0
+
+_PRELUDE = '''
+import tracemalloc, resource, json, sys, os
+sys.path.insert(0, root)
+captchas = os.path.join(root, 'tests', 'captchas')
+
+def rss_kb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+'''
+
+_BINARY_INDEX = '''
+import amazoncaptcha.training as training
+before = rss_kb()
+tracemalloc.start()
+index = training.get_training_index()
+index.get(b'warm')
+print(json.dumps({'traced_kb': tracemalloc.get_traced_memory()[0] // 1024, 'rss_kb': rss_kb() - before}))
+'''
+
+_JSON_INDEX = '''
+import amazoncaptcha.training as training
+before = rss_kb()
+tracemalloc.start()
+index = training.load_training_data()
+print(json.dumps({'traced_kb': tracemalloc.get_traced_memory()[0] // 1024, 'rss_kb': rss_kb() - before}))
+'''
+
+_SOLVE = '''
+from amazoncaptcha import AmazonCaptcha
+paths = [os.path.join(captchas, name) for name in sorted(os.listdir(captchas))]
+images = [open(path, 'rb').read() for path in paths]
+for data in images:
+    AmazonCaptcha(data).solve()
+
+tracemalloc.start()
+peaks, retained = list(), list()
+for round in range(rounds):
+    for data in images:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        AmazonCaptcha(data).solve()
+        after, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - current)
+        retained.append(after - current)
+
+print(json.dumps({'peak_kb': max(peaks) / 1024, 'retained_bytes': max(0, sum(retained) // len(retained))}))
+'''
+
+_BATCH = '''
+from amazoncaptcha import AmazonCaptcha
+from amazoncaptcha.batch import close_pools
+paths = [os.path.join(captchas, name) for name in sorted(os.listdir(captchas))] * copies
+AmazonCaptcha.solve_many(paths, processes=workers, serial_threshold=0)
+close_pools()
+parent, worker = rss_kb(), rss_kb(resource.RUSAGE_CHILDREN)
+print(json.dumps({'parent_kb': parent, 'worker_kb': worker, 'total_kb': parent + workers * worker}))
+'''
+
+#--------------------------------------------------------------------------------------------------------------
+
+def measure(script, **arguments):
+    """
+    Runs a measurement script in a fresh interpreter.
+
+    Args:
+        script (str): Body of the script, printing its results as JSON.
+        **arguments: Variables defined for the script.
+
+    Returns:
+        dict: Results printed by the script.
+
+    """
+
+    root = os.path.dirname(HERE)
+    variables = ''.join(f'{name} = {value!r}\n' for name, value in dict(arguments, root=root).items())
+    source = variables + _PRELUDE + script
+    output = subprocess.run([sys.executable, '-c', source], cwd=root, capture_output=True, text=True, check=True).stdout
+
+    return json.loads(output)
+
+def run(workers=2, rounds=20, copies=8):
+    """
+    Runs every measurement.
+
+    Args:
+        workers (int, optional): Number of worker processes of the batch run.
+        rounds (int, optional): Passes over the test captchas when measuring
+            a single solve.
+        copies (int, optional): Number of times the test captchas are
+            repeated in the batch run.
+
+    Returns:
+        dict: Measurements, flattened into `<measurement>.<value>` keys.
+
+    """
+
+    results = {
+        'binary_index': measure(_BINARY_INDEX),
+        'json_index': measure(_JSON_INDEX),
+        'solve': measure(_SOLVE, rounds=rounds),
+        f'batch_{workers}_workers': measure(_BATCH, workers=workers, copies=copies),
+    }
+
+    return {f'{name}.{key}': value for name, values in results.items() for key, value in values.items()}
+
+def check(results, budget, tolerance=TOLERANCE):
+    """
+    Compares measurements with their budget.
+
+    Args:
+        results (dict): Measurements as returned by `run`.
+        budget (dict): Maximum allowed value of every measurement.
+        tolerance (float, optional): Fraction of the budget a measurement
+            may exceed it by, e.g. 0.25 on an interpreter other than the
+            one the budget was recorded with.
+
+    Returns:
+        :obj:`list` of :obj:`tuple`: Measurement, value, budget and whether
+            it is over budget.
+
+    Raises:
+        KeyError: If a measurement has no budget.
+
+    """
+
+    missing = [key for key in results if key not in budget]
+    if missing:
+        raise KeyError(f'No budget for {", ".join(missing)}, record one with --record')
+
+    return [(key, value, budget[key], value > budget[key] * (1 + tolerance)) for key, value in results.items()]
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Memory budget suite of amazoncaptcha.')
+    parser.add_argument('--workers', type=int, default=2, help='number of workers of the batch run')
+    parser.add_argument('--budget', default=BUDGET_PATH, help='budget file to check against')
+    parser.add_argument('--record', action='store_true', help='write the measurements plus headroom as the new budget')
+    parser.add_argument('--output', help='where to write the JSON measurements')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='fraction of the budget a measurement may exceed it by')
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.workers)
+
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(results, indent=4) + '\n')
+
+    budget = dict()
+    if os.path.isfile(arguments.budget):
+        with open(arguments.budget, 'r', encoding='utf-8') as f:
+            budget = json.load(f)
+
+    if arguments.record:
+        budget.update((key, round(max(value * HEADROOM, value + SLACK))) for key, value in results.items())
+
+        with open(arguments.budget, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(budget, indent=4, sort_keys=True) + '\n')
+
+        print(f'Recorded the budget of {len(results)} measurements to {arguments.budget}')
+        return 0
+
+    try:
+        rows = check(results, budget, arguments.tolerance)
+
+    except KeyError as e:
+        print(e.args[0])
+        return 2
+
+    for key, value, limit, over in rows:
+        print(f'{key:<36} {value:>12.2f} / {limit:>12.2f}' + ('  OVER BUDGET' if over else ''))
+
+    return 1 if any(row[-1] for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+#--------------------------------------------------------------------------------------------------------------
@@ -20,7 +20,6 @@ def readme(logo_end_line=14):
     return long_description
 
 classifiers = [
-    "Programming Language :: Python :: 3.6",
     "Programming Language :: Python :: 3.7",
     "Programming Language :: Python :: 3.8",
     "Programming Language :: Python :: 3.9",
@@ -38,6 +37,11 @@ requires = [
     "requests >= 2.27.1,< 2.31.0"
 ]
 
+extras = {
+    "async": ["aiohttp >= 3.8.1"],
+    "numpy": ["numpy >= 1.21.0"],
+}
+
 #--------------------------------------------------------------------------------------------------------------
 
 setuptools.setup(
@@ -47,11 +51,13 @@ setuptools.setup(
     packages=['amazoncaptcha'],
     py_modules=['devtools', 'exceptions', 'solver', 'utils'],
     include_package_data=True,
-    package_data={'': ['*.json'], 'amazoncaptcha': ['training_data/*.*']},
+    package_data={'': ['*.json'], 'amazoncaptcha': ['training_data/*.*', 'training_data/segments/*.json']},
     classifiers=classifiers,
     long_description=readme(),
     long_description_content_type="text/markdown",
     install_requires=requires,
+    extras_require=extras,
+    python_requires='>=3.7',
     author=about['__author__'],
     author_email=about['__author_email__'],
     url=about['__url__'],
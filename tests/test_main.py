@@ -1,9 +1,38 @@
 # -*- coding: utf-8 -*-
 
-from amazoncaptcha import AmazonCaptcha, AmazonCaptchaCollector, ContentTypeError, NotFolderError, __version__
+from amazoncaptcha import AmazonCaptcha, AmazonCaptchaCollector, ContentTypeError, NotFolderError, TrainingDataError, __version__
+from amazoncaptcha.training import get_training_index, load_training_data, write_binary_index, BinaryTrainingIndex
+from amazoncaptcha.training import fingerprint, fingerprint_from_pseudo_binary, TRAINING_DATA_FOLDER
+from amazoncaptcha.training import open_training_index, compact_training_data, list_segments, SegmentedTrainingIndex
+from amazoncaptcha.engine import SolverEngine, get_default_engine, set_default_engine
+from amazoncaptcha.engine import load_image, monochrome, extract_letters, extract_letters_with_outcome
+from amazoncaptcha import pipeline
+from amazoncaptcha.stats import SolverStats, StatsExporter
+from amazoncaptcha.vectorized import VectorizedEngine, TemplateMatrix
+from amazoncaptcha.nearmatch import NearMatchIndex, BKTree, hamming_distance
+from amazoncaptcha.cache import SolutionCache, MemoryBackend, SocketBackend, CacheServer, cache_keys
+from amazoncaptcha.session import get_session, create_session
+from amazoncaptcha.devtools import AccuracyEvaluator, ingest_training_data
+from amazoncaptcha.utils import find_letter_boxes, column_projection, extract_letter, cut_the_white, merge_horizontally
+from amazoncaptcha import aio
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium import webdriver
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from PIL import Image
+from io import BytesIO
+import subprocess
+import shutil
+import functools
+import pickle
+import random
+import threading
 import unittest
+import asyncio
+import tempfile
+import json
+import zlib
+import ast
 import sys
 import os
 
@@ -13,12 +42,103 @@ here = os.path.abspath(os.path.dirname(__file__))
 captchas_folder = os.path.join(here, 'captchas')
 test_folder = os.path.join(here, 'test_folder')
 
+class QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+class LocalServerTestCase(unittest.TestCase):
+    """Serves the captchas folder over HTTP on localhost."""
+
+    handler = QuietHandler
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(cls.handler, directory=captchas_folder))
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
 class TestAmazonCaptcha(unittest.TestCase):
 
     def test_not_corrupted_image(self):
         solution = AmazonCaptcha(os.path.join(captchas_folder, 'notcorrupted.jpg')).solve()
         self.assertEqual(solution, 'KRJNBY')
 
+    def test_buffers_images_and_arrays(self):
+        import numpy
+
+        with open(os.path.join(captchas_folder, 'notcorrupted.jpg'), 'rb') as f:
+            content = f.read()
+
+        img = Image.open(BytesIO(content)).convert('L')
+        pixels = numpy.asarray(img)
+
+        for captcha_image in (content, bytearray(content), memoryview(content), img, pixels, numpy.asfortranarray(pixels)):
+            self.assertEqual(AmazonCaptcha(captcha_image).solve(), 'KRJNBY')
+
+        pixels = pixels.copy()
+        captcha = AmazonCaptcha(pixels)
+        pixels[0, 0] = 255 - pixels[0, 0]
+        self.assertEqual(captcha.img.getpixel((0, 0)), pixels[0, 0])
+
+        with self.assertRaises(ValueError):
+            AmazonCaptcha(numpy.zeros((70, 200, 3), dtype=numpy.uint8))
+
+    def test_buffers_with_cache(self):
+        with open(os.path.join(captchas_folder, 'notcorrupted.jpg'), 'rb') as f:
+            content = f.read()
+
+        cache = SolutionCache(16)
+        engine = SolverEngine(cache=cache)
+
+        self.assertEqual(AmazonCaptcha(memoryview(content), engine=engine).solve(), 'KRJNBY')
+        self.assertEqual(AmazonCaptcha(bytearray(content), engine=engine).solve(), 'KRJNBY')
+        self.assertEqual(AmazonCaptcha(Image.open(BytesIO(content)), engine=engine).solve(), 'KRJNBY')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_attributes_after_solve(self):
+        path = os.path.join(captchas_folder, 'notcorrupted.jpg')
+        captcha = AmazonCaptcha(path)
+        self.assertEqual(captcha.result, {})
+
+        self.assertEqual(captcha.solve(), 'KRJNBY')
+        self.assertEqual(captcha.result, dict(zip('123456', 'KRJNBY')))
+        self.assertEqual(set(captcha.img.tobytes()), {0, 255})
+        self.assertEqual([get_training_index().get(key) for key in captcha.letters.values()], list('KRJNBY'))
+
+        captcha = AmazonCaptcha(path, engine=SolverEngine(cache=SolutionCache()))
+        captcha.solve()
+        self.assertEqual(captcha.solve(), 'KRJNBY')
+        self.assertEqual(list(captcha.letters), list('123456'))
+
+        captcha = AmazonCaptcha(os.path.join(captchas_folder, 'notsolved.jpg'))
+        self.assertEqual(captcha.solve(), 'Not solved')
+        self.assertEqual(''.join(captcha.result.values()), '------')
+
+    def test_monochrome_of_rgb_jpeg(self):
+        captcha = AmazonCaptcha(os.path.join(captchas_folder, 'notsolved.jpg'))
+        captcha._monochrome()
+
+        histogram = captcha.img.histogram()
+        self.assertEqual(captcha.img.mode, 'L')
+        self.assertEqual(histogram[0] + histogram[255], captcha.img.width * captcha.img.height)
+
+    def test_solve_many(self):
+        names = ['notcorrupted.jpg', 'corrupted.png', 'corrupted_1.png', 'corrupted_2.png', 'notsolved.jpg']
+        paths = [os.path.join(captchas_folder, name) for name in names]
+
+        with open(paths[1], 'rb') as f, open(paths[2], 'rb') as fp:
+            images = [paths[0], f.read(), fp, paths[3], paths[4]] + paths * 3
+            solutions = AmazonCaptcha.solve_many(images, processes=2, chunksize=3, serial_threshold=0)
+
+        self.assertEqual(solutions, ['KRJNBY', 'UGXGMM', 'BPXHGH', 'KMGMXE', 'Not solved'] * 4)
+        self.assertEqual(AmazonCaptcha.solve_many(paths, devmode=True), ['KRJNBY', 'UGXGMM', 'BPXHGH', 'KMGMXE', '------'])
+
     def test_image_link_property_warning(self):
         captcha = AmazonCaptcha(os.path.join(captchas_folder, 'notcorrupted.jpg'))
         self.assertEqual(captcha.image_link, None)
@@ -83,7 +203,8 @@ class TestAmazonCaptcha(unittest.TestCase):
     def test_collector(self):
         collector = AmazonCaptchaCollector(output_folder_path = test_folder)
         collector.get_captcha_image()
-        collector._distribute_collecting(range(4))
+        for i in range(4):
+            collector.get_captcha_image()
 
         self.assertGreaterEqual(len(os.listdir(test_folder)), 4)
 
@@ -103,7 +224,8 @@ class TestAmazonCaptcha(unittest.TestCase):
     def test_accuracy_test(self):
         collector = AmazonCaptchaCollector(output_folder_path = test_folder, accuracy_test=True)
         collector.get_captcha_image()
-        collector._distribute_collecting(range(4))
+        for i in range(4):
+            collector.get_captcha_image()
 
         self.assertIn(f'collector-logs-{__version__.__version__.replace(".", "")}.log', os.listdir(test_folder))
 
@@ -113,4 +235,790 @@ class TestAmazonCaptcha(unittest.TestCase):
 
         self.assertIn('test-results.log', os.listdir(test_folder))
 
+class FlakyHandler(QuietHandler):
+    """Answers every other request with 503 Service Unavailable."""
+
+    requests_count = 0
+
+    def do_GET(self):
+        FlakyHandler.requests_count += 1
+
+        if FlakyHandler.requests_count % 2:
+            self.send_error(503)
+
+        else:
+            super().do_GET()
+
+class ValidateCaptchaHandler(QuietHandler):
+    """Imitates Amazon's validateCaptcha page, every fifth page is broken."""
+
+    pages_count = 0
+    requests_count = 0
+    images = ['notcorrupted.jpg', 'notsolved.jpg']
+
+    def do_GET(self):
+        ValidateCaptchaHandler.requests_count += 1
+
+        if self.path.startswith('/errors/validateCaptcha'):
+            ValidateCaptchaHandler.pages_count += 1
+            number = ValidateCaptchaHandler.pages_count
+            name = self.images[number % len(self.images)]
+
+            if number % 5:
+                body = f'<html><img src="http://{self.headers["Host"]}/captcha/stub/Captcha_{number}x{name}"></html>'
+            else:
+                body = '<html>Try again later</html>'
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+
+        else:
+            self.path = '/' + self.path.split('x', 1)[-1]
+            super().do_GET()
+
+class TestCollector(LocalServerTestCase):
+
+    handler = ValidateCaptchaHandler
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _collector(self, **kwargs):
+        return AmazonCaptchaCollector(self.folder.name, validate_captcha_url=self.url + '/errors/validateCaptcha', **kwargs)
+
+    def test_start_processes_exactly_target(self):
+        results = self._collector().start(target=7, processes=2, report_every=0)
+        stored = [name for name in os.listdir(self.folder.name) if name.endswith('.png')]
+
+        self.assertEqual(results['processed'], 7)
+        self.assertEqual(results['solved'], len(stored))
+        self.assertGreaterEqual(results['errors'], 1)
+        self.assertTrue(all(name.endswith('_KRJNBY.png') for name in stored))
+
+    def test_start_logs_every_captcha_once(self):
+        collector = self._collector(keep_logs=True)
+        results = collector.start(target=6, processes=2, report_every=0)
+
+        with open(collector.collector_logs, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+
+        with open(collector.not_solved_logs, 'r', encoding='utf-8') as f:
+            not_solved = f.read().splitlines()
+
+        self.assertEqual(len(records), 6)
+        self.assertEqual(sum(record['solved'] for record in records), results['solved'])
+        self.assertEqual(sorted(not_solved), sorted(record['link'] for record in records if not record['solved']))
+        self.assertEqual(len({record['id'] for record in records}), 6)
+        self.assertTrue(all(set(record['timings']) == {'download', 'solve', 'store'} for record in records))
+        self.assertEqual(collector.log.summary(), {'processed': 6, 'solved': results['solved'], 'accuracy': round(results['solved'] / 6 * 100, 5)})
+
+    def test_start_with_fewer_captchas_than_processes(self):
+        results = self._collector(accuracy_test=True).start(target=1, processes=3, report_every=0)
+        self.assertEqual(results['processed'], 1)
+
+        with open(os.path.join(self.folder.name, 'test-results.log'), 'r', encoding='utf-8') as f:
+            self.assertRegex(f.read(), r'^::Test::Ver.+::Cap1::Per(0|100)\.0::$')
+
+    def test_astart_processes_exactly_target(self):
+        results = asyncio.run(self._collector().astart(target=9, concurrency=4, report_every=0))
+        stored = [name for name in os.listdir(self.folder.name) if name.endswith('.png')]
+
+        self.assertEqual(results['processed'], 9)
+        self.assertEqual(results['solved'], len(stored))
+        self.assertGreaterEqual(results['errors'], 1)
+
+    def test_astart_with_process_executor(self):
+
+        with ProcessPoolExecutor(2) as executor:
+            results = asyncio.run(self._collector(accuracy_test=True).astart(target=4, executor=executor, report_every=0))
+
+        self.assertEqual(results['processed'], 4)
+        self.assertIn('test-results.log', os.listdir(self.folder.name))
+        self.assertFalse([name for name in os.listdir(self.folder.name) if name.endswith('.png')])
+
+    def test_astart_gives_up_after_max_errors(self):
+        collector = self._collector()
+        collector.validate_captcha_url = self.url + '/missing'
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(collector.astart(target=2, max_errors=3, report_every=0))
+
+    def test_start_gives_up_after_max_errors(self):
+        collector = self._collector()
+        collector.validate_captcha_url = self.url + '/missing'
+
+        with self.assertRaises(RuntimeError):
+            collector.start(target=2, processes=1, max_errors=1, report_every=0)
+
+    def test_start_stops_downloading_after_max_errors(self):
+        collector = self._collector()
+        collector.validate_captcha_url = self.url + '/missing'
+        requests_count = ValidateCaptchaHandler.requests_count
+
+        with self.assertRaises(RuntimeError):
+            collector.start(target=200, processes=1, downloads=2, max_errors=0, report_every=0)
+
+        self.assertLessEqual(ValidateCaptchaHandler.requests_count - requests_count, 2)
+
+class TestEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+        labeled = {
+            'dl_a1_KRJNBY.png': 'notcorrupted.jpg', 'dl_a2_KRJNBX.png': 'notcorrupted.jpg', 'dl_a3_UGXGMM.png': 'corrupted.png',
+            'dl_a4_ABCDEF.png': 'notsolved.jpg', 'dl_a5_ABCDEF.png': 'notsolved_1.jpg', 'unlabeled.png': 'notcorrupted.jpg',
+        }
+
+        for name, source in labeled.items():
+            shutil.copy(os.path.join(captchas_folder, source), os.path.join(self.folder.name, name))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_evaluator_reports_accuracy_and_failures(self):
+        evaluator = AccuracyEvaluator(self.folder.name)
+        results = evaluator.start(processes=1)
+
+        self.assertEqual(results['processed'], 5)
+        self.assertEqual(results['solved'], 2)
+        self.assertEqual(results['accuracy'], 40.0)
+        self.assertEqual(results['failures'], {'wrong_solution': 1, 'unrecognised_letters': 1, 'failed.letter_count': 1})
+        self.assertEqual(results['confusion']['X'], {'X': 1, 'Y': 1})
+        self.assertEqual(results['confusion']['F'], {'-': 1})
+        self.assertEqual(results['confusion']['B'], {'B': 2, '-': 1})
+
+        with open(evaluator.test_results, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), f'::Test::Ver{__version__.__version__}::Cap5::Per40.0::')
+
+    def test_evaluator_in_process_pool(self):
+        results = AccuracyEvaluator(self.folder.name).start(processes=2, chunksize=1, serial_threshold=0)
+        self.assertEqual(results['solved'], 2)
+
+    def test_evaluator_requires_folder(self):
+
+        with self.assertRaises(NotFolderError):
+            AccuracyEvaluator(os.path.join(self.folder.name, 'missing'))
+
+class TestSession(LocalServerTestCase):
+
+    def test_shared_session_fromlink(self):
+        captcha = AmazonCaptcha.fromlink(f'{self.url}/notcorrupted.jpg')
+
+        self.assertIs(get_session(), get_session())
+        self.assertEqual(captcha.solve(), 'KRJNBY')
+        self.assertEqual(captcha.image_link, f'{self.url}/notcorrupted.jpg')
+
+    def test_download_stage_goes_to_the_captcha_engine(self):
+        engine = SolverEngine(stats=SolverStats())
+        captcha = AmazonCaptcha.fromlink(f'{self.url}/notcorrupted.jpg', engine=engine)
+
+        self.assertIs(captcha.engine, engine)
+        self.assertEqual(captcha.solve(), 'KRJNBY')
+        self.assertEqual(engine.stats.snapshot()['stages']['download']['count'], 1)
+
+    def test_fromlink_content_type_error_with_shared_session(self):
+
+        with self.assertRaises(ContentTypeError) as context:
+            AmazonCaptcha.fromlink(f'{self.url}/corrupted.png')
+
+        self.assertTrue('"image/png" is not supported as a Content-Type' in str(context.exception))
+
+class TestSessionRetries(LocalServerTestCase):
+
+    handler = FlakyHandler
+
+    def test_fromlink_retries_transient_errors(self):
+        session = create_session(backoff_factor=0)
+        solutions = [AmazonCaptcha.fromlink(f'{self.url}/notcorrupted.jpg', session=session).solve() for i in range(3)]
+
+        self.assertEqual(solutions, ['KRJNBY'] * 3)
+        self.assertEqual(FlakyHandler.requests_count, 6)
+
+class TestAsyncio(LocalServerTestCase):
+
+    def test_afromlink_and_asolve(self):
+
+        async def solve(names):
+            try:
+                captchas = await asyncio.gather(*[AmazonCaptcha.afromlink(f'{self.url}/{name}') for name in names])
+                return await asyncio.gather(*[captcha.asolve() for captcha in captchas])
+            finally:
+                await aio.close_session()
+
+        solutions = asyncio.run(solve(['notcorrupted.jpg', 'notsolved.jpg'] * 10))
+        self.assertEqual(solutions, ['KRJNBY', 'Not solved'] * 10)
+
+    def test_afromlink_reuses_pooled_session(self):
+
+        async def sessions():
+            try:
+                await AmazonCaptcha.afromlink(f'{self.url}/notcorrupted.jpg')
+                first = aio.get_session()
+                await AmazonCaptcha.afromlink(f'{self.url}/notcorrupted.jpg')
+                return first, aio.get_session()
+            finally:
+                await aio.close_session()
+
+        first, second = asyncio.run(sessions())
+        self.assertIs(first, second)
+        self.assertTrue(first.closed)
+
+    def test_asolve_rejects_process_pools(self):
+        captcha = AmazonCaptcha(os.path.join(captchas_folder, 'notcorrupted.jpg'))
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            with self.assertRaises(TypeError):
+                asyncio.run(captcha.asolve(executor=executor))
+
+    def test_pooled_session_closed_with_loop(self):
+
+        async def session():
+            await AmazonCaptcha.afromlink(f'{self.url}/notcorrupted.jpg')
+            return aio.get_session()
+
+        session = asyncio.run(session())
+        self.assertTrue(session.closed)
+        self.assertEqual(len(aio._loop_states), 0)
+
+    def test_afromlink_content_type_error(self):
+
+        async def request():
+            try:
+                await AmazonCaptcha.afromlink(f'{self.url}/corrupted.png')
+            finally:
+                await aio.close_session()
+
+        with self.assertRaises(ContentTypeError) as context:
+            asyncio.run(request())
+
+        self.assertTrue('is not supported as a Content-Type' in str(context.exception))
+
+class TestSolverEngine(unittest.TestCase):
+
+    solutions = {
+        'notcorrupted.jpg': 'KRJNBY',
+        'corrupted.png': 'UGXGMM',
+        'corrupted_1.png': 'BPXHGH',
+        'corrupted_2.png': 'KMGMXE',
+        'notsolved.jpg': 'Not solved',
+    }
+
+    def test_engine_is_reused(self):
+        self.assertIs(AmazonCaptcha(os.path.join(captchas_folder, 'notcorrupted.jpg')).engine, get_default_engine())
+
+    def test_engine_solves_from_many_threads(self):
+        engine = SolverEngine()
+        names = list(self.solutions) * 20
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            solutions = list(executor.map(lambda name: engine.solve(os.path.join(captchas_folder, name)), names))
+
+        self.assertEqual(solutions, [self.solutions[name] for name in names])
+
+    def test_engine_with_custom_training_index(self):
+        engine = SolverEngine(training_index=dict())
+
+        self.assertEqual(engine.solve(os.path.join(captchas_folder, 'notcorrupted.jpg')), 'Not solved')
+        self.assertEqual(engine.solve(os.path.join(captchas_folder, 'notcorrupted.jpg'), devmode=True), '------')
+
+class TestSolutionCache(unittest.TestCase):
+
+    def _read(self, name):
+
+        with open(os.path.join(captchas_folder, name), 'rb') as f:
+            return f.read()
+
+    def test_cache_hit_skips_solving(self):
+        data = self._read('notcorrupted.jpg')
+        cache = SolutionCache()
+        cache.store(cache_keys(data), 'ABCDE-')
+
+        engine = SolverEngine(cache=cache)
+        self.assertEqual(AmazonCaptcha(BytesIO(data), engine=engine).solve(), 'Not solved')
+        self.assertEqual(engine.solve(data, devmode=True), 'ABCDE-')
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 0, 'size': 1})
+
+    def test_cache_miss_stores_solution(self):
+        engine = SolverEngine(cache=SolutionCache())
+        path = os.path.join(captchas_folder, 'notsolved.jpg')
+
+        self.assertEqual([engine.solve(path) for i in range(3)], ['Not solved'] * 3)
+        self.assertEqual(engine.solve(path, devmode=True), '------')
+        self.assertEqual(engine.cache.stats(), {'hits': 3, 'misses': 1, 'size': 1})
+
+    def test_cache_keyed_by_content(self):
+        link = 'https://images-na.ssl-images-amazon.com/captcha/usvmgloq/Captcha_kwrrnqwkph.jpg'
+        engine = SolverEngine(cache=SolutionCache())
+
+        self.assertEqual(AmazonCaptcha(self._read('notcorrupted.jpg'), link, engine=engine).solve(), 'KRJNBY')
+        self.assertEqual(AmazonCaptcha(self._read('corrupted.png'), link, engine=engine).solve(), 'UGXGMM')
+        self.assertEqual(engine.solve(self._read('corrupted.png')), 'UGXGMM')
+        self.assertEqual(engine.cache.stats(), {'hits': 1, 'misses': 2, 'size': 2})
+
+    def test_cache_get_set_match_lookup_store(self):
+        data = self._read('notcorrupted.jpg')
+        key = cache_keys(data)[0]
+
+        cache = SolutionCache()
+        cache.set(key, 'KRJNBY')
+        self.assertEqual(cache.lookup(cache_keys(data)), 'KRJNBY')
+
+        cache.store(cache_keys(data), 'ABCDE-')
+        self.assertEqual(cache.get(key), 'ABCDE-')
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 0, 'size': 1})
+
+    def test_failing_backends_count_as_misses(self):
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'corrupted.sqlite')
+            with open(path, 'wb') as f:
+                f.write(b'not a database' * 100)
+
+            cache = SolutionCache(path=path)
+            engine = SolverEngine(cache=cache)
+
+            self.assertEqual(engine.solve(self._read('notcorrupted.jpg')), 'KRJNBY')
+            self.assertEqual(cache.errors, 2)
+            self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1, 'size': 1})
+
+            cache.close()
+
+    def test_socket_backend_error_response(self):
+        server = CacheServer()
+        server.start()
+        backend = SocketBackend(server.server_address)
+
+        with self.assertRaises(ValueError) as context:
+            backend._request({'op': 'unknown'})
+
+        self.assertTrue('answered with an error' in str(context.exception))
+
+        backend.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_cache_lru_eviction(self):
+        cache = SolutionCache(maxsize=2)
+        cache.set('a', 'AAAAAA')
+        cache.set('b', 'BBBBBB')
+        cache.get('a')
+        cache.set('c', 'CCCCCC')
+
+        self.assertEqual([cache.get(key) for key in 'abc'], ['AAAAAA', None, 'CCCCCC'])
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'size': 2})
+
+    def test_cache_on_disk_tier(self):
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'solutions.sqlite')
+
+            SolutionCache(path=path).set('a', 'AAAAAA')
+            cache = SolutionCache(path=path)
+
+            self.assertEqual(cache.get('a'), 'AAAAAA')
+            self.assertEqual(cache.stats()['size'], 1)
+
+            cache.clear()
+            self.assertIsNone(SolutionCache(path=path).get('a'))
+            cache.close()
+
+    def test_cache_batch_lookup(self):
+        backend = MemoryBackend()
+        backend.set_many({'sha:a': 'AAAAAA', 'sha:b': 'BBBBBB'})
+        calls = []
+        get_many = backend.get_many
+        backend.get_many = lambda keys: calls.append(sorted(keys)) or get_many(keys)
+
+        cache = SolutionCache(backend=backend)
+        solutions = cache.lookup_many([['sha:a'], ['sha:b'], ['sha:c'], ['sha:d']])
+
+        self.assertEqual(solutions, ['AAAAAA', 'BBBBBB', None, None])
+        self.assertEqual(calls, [['sha:a', 'sha:b', 'sha:c', 'sha:d']])
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 2, 'size': 2})
+
+    def test_cache_shared_over_socket(self):
+        server = CacheServer()
+        server.start()
+
+        try:
+            first = SolutionCache(backend=SocketBackend(server.server_address))
+            second = SolutionCache(backend=SocketBackend(server.server_address))
+
+            data = self._read('notcorrupted.jpg')
+            self.assertEqual(SolverEngine(cache=first).solve(data), 'KRJNBY')
+            self.assertEqual(second.lookup(cache_keys(data)), 'KRJNBY')
+            self.assertEqual(len(server.backend), 1)
+
+            first.close()
+            second.close()
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_cache_survives_unreachable_backend(self):
+        server = CacheServer()
+        address = server.server_address
+        server.server_close()
+
+        engine = SolverEngine(cache=SolutionCache(backend=SocketBackend(address, timeout=1)))
+        self.assertEqual(engine.solve(self._read('notcorrupted.jpg')), 'KRJNBY')
+        self.assertEqual(engine.cache.errors, 2)
+
+    def test_solve_many_looks_up_batch_once(self):
+        cache = SolutionCache()
+        paths = [os.path.join(captchas_folder, name) for name in ('notcorrupted.jpg', 'corrupted.png', 'notsolved.jpg')]
+        cache.store(cache_keys(self._read('notsolved.jpg')), 'ABCDEF')
+
+        default_engine = get_default_engine()
+        set_default_engine(SolverEngine(cache=cache))
+
+        try:
+            self.assertEqual(AmazonCaptcha.solve_many(paths, processes=1), ['KRJNBY', 'UGXGMM', 'ABCDEF'])
+            self.assertEqual(AmazonCaptcha.solve_many(paths, processes=1), ['KRJNBY', 'UGXGMM', 'ABCDEF'])
+            self.assertEqual(cache.stats(), {'hits': 4, 'misses': 2, 'size': 3})
+
+        finally:
+            set_default_engine(default_engine)
+
+class TestImportTime(unittest.TestCase):
+
+    heavy_modules = ['requests', 'urllib3', 'selenium', 'multiprocessing', 'aiohttp', 'numpy', 'sqlite3', 'amazoncaptcha.devtools']
+
+    def _loaded_modules(self, code):
+        script = f'import sys, json\n{code}\nprint(json.dumps([m for m in {self.heavy_modules!r} if m in sys.modules]))'
+        output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(here), capture_output=True, text=True, check=True).stdout
+
+        return json.loads(output)
+
+    def test_import_is_lazy(self):
+        self.assertEqual(self._loaded_modules('import amazoncaptcha'), [])
+
+    def test_solving_local_images_stays_lazy(self):
+        path = os.path.join(captchas_folder, 'notcorrupted.jpg')
+        self.assertEqual(self._loaded_modules(f'from amazoncaptcha import AmazonCaptcha\nAmazonCaptcha({path!r}).solve()'), [])
+
+    def test_lazy_collector_import(self):
+        loaded = self._loaded_modules('import amazoncaptcha\namazoncaptcha.AmazonCaptchaCollector')
+        self.assertIn('amazoncaptcha.devtools', loaded)
+        self.assertIn('requests', loaded)
+
+class TestSolverStats(unittest.TestCase):
+
+    def test_stages_and_outcomes(self):
+        engine = SolverEngine(stats=SolverStats(), cache=SolutionCache())
+        names = ['corrupted.png', 'notcorrupted.jpg', 'notsolved.jpg', 'notsolved_1.jpg', 'notcorrupted.jpg']
+
+        for name in names:
+            engine.solve(os.path.join(captchas_folder, name))
+
+        snapshot = engine.stats.snapshot()
+        self.assertEqual(set(snapshot['stages']), {'decode', 'monochrome', 'segment', 'extract', 'fingerprint', 'classify', 'solve'})
+        self.assertEqual(snapshot['stages']['solve']['count'], 5)
+        self.assertEqual(snapshot['stages']['decode']['count'], 4)
+        self.assertEqual(snapshot['counters'], {
+            'segment.wrapped_letter': 1, 'segment.six_letters': 2, 'segment.failed.letter_count': 1,
+            'letters.found': 12, 'letters.unrecognised': 12, 'cache.hit': 1, 'cache.miss': 4, 'solve.solved': 3, 'solve.not_solved': 2,
+        })
+
+    def test_extract_letters_with_outcome(self):
+        outcomes = {'corrupted.png': 'wrapped_letter', 'notcorrupted.jpg': 'six_letters', 'notsolved_1.jpg': 'failed.letter_count'}
+
+        for name, expected in outcomes.items():
+            img = monochrome(load_image(os.path.join(captchas_folder, name)))
+            letters, outcome = extract_letters_with_outcome(img)
+
+            self.assertEqual(outcome, expected)
+            self.assertEqual(letters, extract_letters(img))
+
+    def test_batch_stats(self):
+        engine = SolverEngine(stats=SolverStats())
+        paths = [os.path.join(captchas_folder, name) for name in ('corrupted.png', 'notsolved.jpg')]
+
+        self.assertEqual(engine.solve_batch(paths), ['UGXGMM', 'Not solved'])
+        self.assertEqual(engine.stats.snapshot()['counters']['solve.solved'], 1)
+        self.assertEqual(engine.stats.snapshot(reset=True)['stages']['classify']['count'], 1)
+        self.assertEqual(engine.stats.snapshot(), {'stages': {}, 'counters': {}})
+
+    def test_exporter(self):
+        stats = SolverStats()
+        stats.count('solve.solved', 2)
+        snapshots = []
+
+        exporter = StatsExporter(stats, snapshots.append, interval=0.01, reset=True)
+        exporter.start()
+        exporter.stop()
+
+        self.assertEqual(sum(snapshot['counters'].get('solve.solved', 0) for snapshot in snapshots), 2)
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'stats.jsonl')
+            StatsExporter(stats, path).export()
+
+            with open(path, 'r', encoding='utf-8') as f:
+                self.assertEqual(json.loads(f.readline())['counters'], {})
+
+class TestPipeline(unittest.TestCase):
+
+    def test_stages_match_solver(self):
+
+        for name in os.listdir(captchas_folder):
+            path = os.path.join(captchas_folder, name)
+
+            bitmap = pipeline.preprocess(path)
+            letter_boxes = pipeline.segment(bitmap)
+            fingerprints = pipeline.fingerprint_letters(bitmap, letter_boxes)
+            letters = pipeline.classify(fingerprints)
+
+            self.assertEqual(pipeline.join_letters(letters, devmode=True), AmazonCaptcha(path, devmode=True).solve())
+
+    def test_stage_outputs_cross_process_boundaries(self):
+        bitmap = pipeline.preprocess(os.path.join(captchas_folder, 'corrupted.png'))
+        letter_boxes = json.loads(json.dumps(pipeline.segment(pickle.loads(pickle.dumps(bitmap)))))
+        fingerprints = pipeline.fingerprint_letters(bitmap, letter_boxes)
+        encoded = json.loads(json.dumps(pipeline.encode_fingerprints(fingerprints)))
+
+        self.assertEqual(len(letter_boxes), 6)
+        self.assertEqual(pipeline.decode_fingerprints(encoded), fingerprints)
+        self.assertEqual(''.join(pipeline.classify(pipeline.decode_fingerprints(encoded))), 'UGXGMM')
+
+    def test_failed_segmentation(self):
+        bitmap = pipeline.preprocess(os.path.join(captchas_folder, 'notsolved_1.jpg'))
+        self.assertIsNone(pipeline.segment(bitmap))
+        self.assertEqual(pipeline.classify(pipeline.fingerprint_letters(bitmap, None)), [None] * 6)
+
+class TestVectorizedEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = VectorizedEngine()
+
+    def test_vectorized_engine_matches_exact_engine(self):
+        paths = [os.path.join(captchas_folder, name) for name in sorted(os.listdir(captchas_folder))]
+        expected = [AmazonCaptcha(path, devmode=True).solve() for path in paths]
+
+        self.assertEqual(self.engine.solve_batch(paths, devmode=True), expected)
+        self.assertEqual([AmazonCaptcha(path, devmode=True, engine=self.engine).solve() for path in paths], expected)
+
+    def test_templates_classify_training_data(self):
+        training_data = load_training_data()
+        keys = list(training_data)
+
+        self.assertEqual(len(self.engine.templates), len(keys))
+        self.assertEqual(self.engine.templates.classify_many(keys), [training_data[key] for key in keys])
+        self.assertEqual(self.engine.templates.classify_many([b'\xff' * 4, keys[0] + b'\x01']), [None, None])
+
+    def test_templates_near_match(self):
+        key, letter = next(iter(load_training_data().items()))
+        flipped = key[:4] + (int.from_bytes(key[4:], 'big') ^ 0b101).to_bytes(len(key) - 4, 'big')
+
+        self.assertIsNone(self.engine.templates.get(flipped))
+        self.assertEqual(TemplateMatrix(load_training_data(), max_distance=2).get(flipped), letter)
+
+    def test_templates_near_match_batch(self):
+        training_data = load_training_data()
+        templates = TemplateMatrix(training_data, max_distance=8)
+        rng = random.Random(7)
+        keys = rng.sample(list(training_data), 200)
+
+        noisy = list()
+        for key in keys:
+            count = int.from_bytes(key[:4], 'big')
+            value = int.from_bytes(key[4:], 'big')
+
+            for bit in rng.sample(range(count), min(count, rng.randint(1, 12))):
+                value ^= 1 << bit
+
+            noisy.append(key[:4] + value.to_bytes(len(key) - 4, 'big'))
+
+        expected = list()
+        for key in noisy:
+            pixels = int.from_bytes(key[4:], 'big')
+            distance, letter = min((hamming_distance(pixels, int.from_bytes(other[4:], 'big')), letter) for other, letter in training_data.items() if other[:4] == key[:4])
+            expected.append(letter if distance <= 8 else None)
+
+        self.assertEqual(templates.classify_many(noisy), expected)
+        self.assertTrue(any(expected) and not all(expected))
+
+class TestNearMatchIndex(unittest.TestCase):
+
+    def test_bk_tree_matches_linear_search(self):
+        randomizer = random.Random(0)
+        entries = [(randomizer.getrandbits(64), letter) for letter in 'ABCDEFGHKMNPRTUXY' * 20]
+        tree = BKTree()
+
+        for pixels, letter in entries:
+            tree.add(pixels, letter)
+
+        for i in range(50):
+            pixels = randomizer.getrandbits(64)
+            distance, letter = min((hamming_distance(pixels, other), letter) for other, letter in entries)
+            expected = (letter, distance) if distance <= 24 else None
+            self.assertEqual(tree.nearest(pixels, 24), expected)
+
+    def test_near_match_fallback(self):
+        key, letter = next(iter(load_training_data().items()))
+        flipped = key[:4] + (int.from_bytes(key[4:], 'big') ^ 0b101).to_bytes(len(key) - 4, 'big')
+
+        index = NearMatchIndex(max_distance=2)
+        self.assertEqual(index.get(key), letter)
+        self.assertEqual(index.nearest(flipped), (letter, 2))
+        self.assertEqual(index.get(flipped), letter)
+        self.assertIsNone(NearMatchIndex(max_distance=1).get(flipped))
+        self.assertIsNone(index.get(b'\xff' * 4))
+
+    def test_exact_matches_skip_the_trees(self):
+        index = NearMatchIndex(exact_index={b'key': 'A'})
+        self.assertEqual(index.get(b'key'), 'A')
+        self.assertIsNone(index._trees)
+
+    def test_engine_with_near_match_index(self):
+        engine = SolverEngine(training_index=NearMatchIndex())
+
+        for name in os.listdir(captchas_folder):
+            path = os.path.join(captchas_folder, name)
+            self.assertEqual(engine.solve(path, devmode=True), AmazonCaptcha(path, devmode=True).solve())
+
+class TestUtils(unittest.TestCase):
+
+    def _monochromed(self, name):
+        captcha = AmazonCaptcha(os.path.join(captchas_folder, name))
+        captcha._monochrome()
+
+        return captcha.img
+
+    def test_column_projection(self):
+        img = self._monochromed('notcorrupted.jpg')
+        projection = column_projection(img.tobytes(), img.width)
+
+        self.assertEqual(len(projection), img.width)
+        self.assertEqual(sum(projection), img.histogram()[0])
+
+    def test_letter_boxes_with_letters_overlapping(self):
+        letter_boxes = find_letter_boxes(self._monochromed('corrupted_1.png'), 33)
+        self.assertEqual(letter_boxes, [(22, 47), (48, 70), (72, 100), (102, 130), (132, 158), (159, 187)])
+
+    def test_letter_boxes_with_last_letter_ending_at_the_beginning(self):
+        letter_boxes = find_letter_boxes(self._monochromed('corrupted.png'), 33)
+        self.assertEqual(letter_boxes, [(0, 14), (23, 50), (53, 82), (84, 113), (116, 145), (147, 180), (181, 199)])
+
+    def test_extract_letter_matches_cropped_letters(self):
+        img = self._monochromed('corrupted.png')
+        data = img.tobytes()
+        projection = column_projection(data, img.width)
+        letter_boxes = find_letter_boxes(img, 33, projection)
+
+        for letter_box in letter_boxes[1:6]:
+            letter = cut_the_white(img.crop((letter_box[0], 0, letter_box[1], img.height)))
+            self.assertEqual(extract_letter(data, img.width, img.height, [letter_box], projection)[1], letter.tobytes())
+
+        merged = merge_horizontally(*[img.crop((letter_box[0], 0, letter_box[1], img.height)) for letter_box in (letter_boxes[6], letter_boxes[0])])
+        (segments, top, bottom), letter = extract_letter(data, img.width, img.height, [letter_boxes[6], letter_boxes[0]], projection)
+
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(letter, cut_the_white(merged).tobytes())
+
+class TestTrainingIndex(unittest.TestCase):
+
+    def test_training_index_is_built_once(self):
+        self.assertIs(get_training_index(), get_training_index())
+
+    def test_training_index_contains_every_letter(self):
+        training_index = get_training_index()
+
+        for key, letter in load_training_data().items():
+            self.assertEqual(training_index.get(key), letter)
+
+    def test_fingerprint_matches_pseudo_binary(self):
+
+        with open(os.path.join(TRAINING_DATA_FOLDER, 'A.json'), 'r', encoding='utf-8') as f:
+            pseudo_binary = json.loads(f.read())[0]
+
+        letter_data_string = zlib.decompress(ast.literal_eval(pseudo_binary))
+        letter_data = bytes(0 if pix == ord('1') else 255 for pix in letter_data_string)
+
+        self.assertEqual(fingerprint(letter_data), fingerprint_from_pseudo_binary(pseudo_binary))
+        self.assertEqual(get_training_index().get(fingerprint(letter_data)), 'A')
+
+    def test_binary_index_matches_training_data(self):
+        training_data = load_training_data()
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'index.bin')
+            self.assertEqual(write_binary_index(training_data, path), len(training_data))
+
+            binary_index = BinaryTrainingIndex(path)
+            self.assertEqual(len(binary_index.letters()), 18)
+            self.assertIsNone(binary_index.get(b'not a fingerprint'))
+
+            for key, letter in training_data.items():
+                self.assertEqual(binary_index.get(key), letter)
+
+            binary_index.close()
+
+    def test_binary_index_error(self):
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'index.bin')
+            with open(path, 'wb') as f:
+                f.write(b'not an index')
+
+            with self.assertRaises(TrainingDataError) as context:
+                BinaryTrainingIndex(path)
+
+        self.assertTrue('is not a supported binary index' in str(context.exception))
+
+class TestTrainingIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.training_folder = os.path.join(self.folder.name, 'training_data')
+        self.source_folder = os.path.join(self.folder.name, 'labeled')
+
+        shutil.copytree(TRAINING_DATA_FOLDER, self.training_folder)
+        os.mkdir(self.source_folder)
+
+        labeled = {'dl_a1_KRJNBY.png': 'notcorrupted.jpg', 'dl_a2_KRJNBX.png': 'notcorrupted.jpg', 'dl_a3_ABCDEF.png': 'notsolved.jpg', 'dl_a4_ABCDEF.png': 'notsolved_1.jpg'}
+        for name, source in labeled.items():
+            shutil.copy(os.path.join(captchas_folder, source), os.path.join(self.source_folder, name))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_ingestion_appends_only_new_letters(self):
+        report = ingest_training_data(self.source_folder, self.training_folder)
+
+        self.assertEqual((report['images'], report['added'], report['redundant']), (4, 6, 11))
+        self.assertEqual(report['conflicts'], [{'image': 'dl_a2_KRJNBX.png', 'position': 5, 'letter': 'X', 'stored': 'Y'}])
+        self.assertEqual(report['skipped'], ['dl_a4_ABCDEF.png'])
+        self.assertFalse(report['compacted'])
+        self.assertEqual(list_segments(self.training_folder), [report['segment']])
+
+        training_index = open_training_index(self.training_folder)
+        self.assertIsInstance(training_index, SegmentedTrainingIndex)
+        self.assertEqual(len(training_index), len(load_training_data(TRAINING_DATA_FOLDER)) + 6)
+        self.assertEqual(SolverEngine(training_index).solve(os.path.join(captchas_folder, 'notsolved.jpg')), 'ABCDEF')
+        training_index.close()
+
+        report = ingest_training_data(self.source_folder, self.training_folder)
+        self.assertEqual((report['added'], report['redundant'], report['segment']), (0, 17, None))
+
+    def test_compaction_merges_segments(self):
+        ingest_training_data(self.source_folder, self.training_folder, max_segments=0)
+
+        self.assertFalse(list_segments(self.training_folder))
+        self.assertEqual(compact_training_data(self.training_folder), 0)
+
+        training_index = open_training_index(self.training_folder)
+        self.assertIsInstance(training_index, BinaryTrainingIndex)
+        self.assertEqual(len(training_index), len(load_training_data(self.training_folder)))
+        self.assertEqual(SolverEngine(training_index).solve(os.path.join(captchas_folder, 'notsolved.jpg')), 'ABCDEF')
+        training_index.close()
+
 #--------------------------------------------------------------------------------------------------------------